@@ -0,0 +1,204 @@
+from collections import OrderedDict
+import numpy as np
+import threading
+import logging
+import time
+import os
+
+"""
+Caché semántica de respuestas | Semantic answer cache.
+Guarda la respuesta y el contexto de cada pregunta junto con su embedding. Una pregunta nueva cuyo
+embedding tenga una similitud coseno mayor al umbral con una pregunta ya respondida recibe la respuesta
+guardada, sin volver a generar preguntas, buscar en Qdrant ni llamar al LLM.
+La invalidación se comparte entre procesos (varios workers de la API, Streamlit y la API a la vez) con un
+archivo de generación: quien ingiere lo reescribe y los demás procesos vacían su caché al ver el cambio.
+"""
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """
+    A thread-safe cache of answers looked up by embedding similarity.
+
+    Attributes
+    ----------
+    threshold : float
+        Minimum cosine similarity for a cached question to be considered the same question.
+    max_entries : int
+        Maximum number of cached answers; the least recently used are evicted first.
+    ttl : float
+        Seconds an answer stays valid, None to keep it until it is evicted or invalidated.
+    generation : int
+        Counter increased every time the collections change and the cache is invalidated, in this or another process.
+    generation_path : str
+        File shared by the processes, rewritten on every invalidation. None to only invalidate this process.
+
+    Methods
+    -------
+    lookup(vector) -> dict or None
+        Returns the cached entry of the most similar question above the threshold.
+    store(vector, question, answer, context, generation)
+        Caches the answer and the context of a question.
+    invalidate()
+        Drops every cached answer, for example after new documents are ingested.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=256, ttl=3600.0, generation_path=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation_path = generation_path
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._shared_stamp = self._read_stamp()
+
+    def _read_stamp(self):
+        #The content of the shared generation file, None if there is none yet
+        if not self.generation_path:
+            return None
+        try:
+            with open(self.generation_path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _sync(self):
+        #Drop the answers if another process invalidated the cache since the last check; called with the lock held
+        stamp = self._read_stamp()
+        if stamp != self._shared_stamp:
+            self._shared_stamp = stamp
+            self._entries.clear()
+            self._generation += 1
+            logger.info("Answer cache invalidated by another process")
+
+    @property
+    def generation(self):
+        with self._lock:
+            self._sync()
+            return self._generation
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created_at"] > self.ttl
+
+    def lookup(self, vector):
+        """
+        Returns the cached entry of the most similar question above the threshold.
+
+        Parameters
+        ----------
+        vector : list of float
+            The embedding of the new question.
+
+        Returns
+        -------
+        dict or None
+            The entry with `question`, `answer`, `context` and `similarity`, or None on a miss.
+        """
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._sync()
+            for entry_id in [i for i, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[entry_id]
+
+            best_id, best_similarity = None, self.threshold
+            for entry_id, entry in self._entries.items():
+                if entry["vector"].shape != query.shape:
+                    continue
+                similarity = float(np.dot(entry["vector"], query))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            logger.info(f"Answer cache hit for '{entry['question']}' (similarity {best_similarity:.3f})")
+            return {
+                "question": entry["question"],
+                "answer": entry["answer"],
+                "context": entry["context"],
+                "similarity": best_similarity,
+            }
+
+    def store(self, vector, question, answer, context, generation=None):
+        """
+        Caches the answer and the context of a question.
+
+        Parameters
+        ----------
+        vector : list of float
+            The embedding of the question.
+        question : str
+            The question.
+        answer : str
+            The generated answer.
+        context : object
+            The context used to generate the answer.
+        generation : int, optional
+            The `generation` read before the answer was generated. If the collections changed
+            meanwhile, the answer is stale and it is not cached.
+        """
+        with self._lock:
+            self._sync()
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[self._next_id] = {
+                "vector": self._normalize(vector),
+                "question": question,
+                "answer": answer,
+                "context": context,
+                "created_at": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Drops every cached answer, for example after new documents are ingested, in every process.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            if self.generation_path:
+                self._shared_stamp = f"{os.getpid()}:{time.time_ns()}"
+                directory = os.path.dirname(self.generation_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                temp_path = f"{self.generation_path}.{os.getpid()}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(self._shared_stamp)
+                os.replace(temp_path, self.generation_path)
+        logger.info("Answer cache invalidated")
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the number of cached answers.
+        """
+        with self._lock:
+            self._sync()
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "generation": self._generation}
+
+
+#Caché única del proceso | Single process-wide cache
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 256)),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", 3600.0)),
+    generation_path=os.getenv("ANSWER_CACHE_GENERATION_PATH", ".cache/answer_cache_generation"),
+)
@@ -0,0 +1,286 @@
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from metrics import metrics
+from dotenv import load_dotenv
+from typing import List
+import asyncio
+import logging
+import time
+import os
+
+"""
+Servicio HTTP de preguntas y respuestas | Headless question-answering HTTP service.
+Expone el pipeline de Chatbot e IngestData como un servicio ASGI (FastAPI + uvicorn) con /ask, /ask/stream,
+/ask_batch e /ingest. Los clientes de Qdrant, los modelos y las cachés son los del proceso, así que se
+comparten entre peticiones. La concurrencia está acotada: cuando la cola está llena se responde 503 con
+Retry-After en lugar de acumular peticiones.
+Con varios workers (API_WORKERS) o junto a Streamlit, cada proceso tiene sus propias cachés; la caché de
+respuestas, el índice léxico y el manifiesto de ingesta detectan los cambios hechos por otro proceso en
+sus archivos compartidos de .cache antes de usarse.
+
+Usage:
+    python api.py  |  uvicorn api:app --host 0.0.0.0 --port 8000
+"""
+logger = logging.getLogger(__name__)
+
+#Cargar las variables de entorno | Load environment variables
+load_dotenv()
+
+
+class Admission:
+    """
+    Bounded concurrency with backpressure: at most `max_concurrency` jobs run at once, at most
+    `max_queue` more wait for a slot, and the rest are rejected with 503 right away.
+
+    Attributes
+    ----------
+    name : str
+        Name of the pool, used in the metrics.
+    max_concurrency : int
+        Jobs running at once.
+    max_queue : int
+        Jobs waiting for a slot.
+    pending : int
+        Jobs admitted that did not finish yet, running or waiting.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue, retry_after=1):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.pending = 0
+        self._semaphore = None
+
+    def reserve(self, count=1):
+        """
+        Admits `count` jobs, or raises a 503 if they do not fit in the queue.
+        """
+        if self.pending + count > self.max_concurrency + self.max_queue:
+            metrics.increment("api_rejected_total", pool=self.name)
+            raise HTTPException(status_code=503, detail=f"The {self.name} queue is full, retry later",
+                                headers={"Retry-After": str(self.retry_after)})
+        self.pending += count
+
+    def release(self, count=1):
+        self.pending -= count
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Waits for a free slot and holds it while the job runs.
+        """
+        #Created on first use, inside the event loop of the server
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.perf_counter()
+        async with self._semaphore:
+            metrics.observe("api_queue_seconds", time.perf_counter() - start, pool=self.name)
+            yield
+
+
+class AskRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+
+
+class ContextDocument(BaseModel):
+    text: str
+    collection: str = ""
+    score: float = None
+
+
+class AskResponse(BaseModel):
+    question: str
+    answer: str
+    context: List[ContextDocument] = []
+    seconds: float
+    error: str = None
+
+
+class BatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1)
+
+
+class BatchResponse(BaseModel):
+    answers: List[AskResponse]
+
+
+class IngestResponse(BaseModel):
+    files: List[str]
+    seconds: float
+
+
+class UploadedPDF:
+    """
+    An uploaded PDF read in place from its spooled temporary file, with the `name` and `size` IngestData uses,
+    so large uploads are not copied into memory.
+    """
+
+    def __init__(self, upload):
+        self.file = upload.file
+        self.name = upload.filename
+        self.size = upload.size
+        self.file.seek(0)
+
+    def __getattr__(self, attribute):
+        return getattr(self.file, attribute)
+
+
+questions_pool = Admission("ask", int(os.getenv("API_MAX_CONCURRENCY", 4)), int(os.getenv("API_MAX_QUEUE", 16)))
+ingest_pool = Admission("ingest", int(os.getenv("API_INGEST_CONCURRENCY", 1)), int(os.getenv("API_INGEST_QUEUE", 2)),
+                        retry_after=30)
+#A batch is admitted whole, so it can never be larger than the running plus waiting slots
+max_batch = min(int(os.getenv("API_MAX_BATCH", 32)), questions_pool.max_concurrency + questions_pool.max_queue)
+
+
+def _context(documents):
+    return [ContextDocument(text=doc.page_content, collection=doc.metadata.get("collection", ""),
+                            score=doc.metadata.get("rrf_score", doc.metadata.get("score")))
+            for doc in documents or []]
+
+
+def _answer(question):
+    """
+    Runs the whole pipeline for one question, on a worker thread.
+    """
+    from chatbot import Chatbot
+
+    start = time.perf_counter()
+    chatbot = Chatbot(question=question)
+    answer = chatbot.input()
+    return AskResponse(question=question, answer=answer, context=_context(chatbot.context),
+                       seconds=time.perf_counter() - start)
+
+
+async def _ask(question):
+    async with questions_pool.slot():
+        with metrics.timer("api_request_seconds", endpoint="ask"):
+            return await asyncio.to_thread(_answer, question)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    #Create the missing Qdrant collections once, the service still starts if Qdrant is not up yet
+    from db import VectorDB
+    try:
+        await asyncio.to_thread(VectorDB(text=None).bootstrap)
+    except Exception as e:
+        logger.error(f"Could not bootstrap the Qdrant collections: {e}")
+    yield
+
+
+app = FastAPI(title="PDF question answering", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "ask_pending": questions_pool.pending, "ingest_pending": ingest_pool.pending}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return metrics.to_prometheus()
+
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(request: AskRequest):
+    """
+    Answers one question.
+    """
+    questions_pool.reserve()
+    try:
+        return await _ask(request.question)
+    finally:
+        questions_pool.release()
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: AskRequest):
+    """
+    Answers one question, streaming the answer as plain text while the LLM generates it.
+    """
+    from chatbot import Chatbot
+
+    #Reserved before the response starts, so a full queue is still answered with 503
+    questions_pool.reserve()
+    released = False
+
+    def release():
+        #Called by the generator and by the background task, whichever runs first; the generator does not
+        #run at all if the client leaves before the body is sent, and the background task is skipped on errors
+        nonlocal released
+        if not released:
+            released = True
+            questions_pool.release()
+
+    async def tokens():
+        try:
+            async with questions_pool.slot():
+                with metrics.timer("api_request_seconds", endpoint="ask_stream"):
+                    chatbot = await asyncio.to_thread(Chatbot, request.question)
+                    #The synchronous generator runs on worker threads, one token at a time
+                    async for token in iterate_in_threadpool(chatbot.stream()):
+                        yield token
+        finally:
+            release()
+
+    return StreamingResponse(tokens(), media_type="text/plain; charset=utf-8", background=BackgroundTask(release))
+
+
+@app.post("/ask_batch", response_model=BatchResponse)
+async def ask_batch(request: BatchRequest):
+    """
+    Answers a batch of questions, running them concurrently within the shared worker limit.
+    """
+    if len(request.questions) > max_batch:
+        raise HTTPException(status_code=413, detail=f"At most {max_batch} questions per batch")
+
+    #The whole batch is admitted or rejected at once
+    questions_pool.reserve(len(request.questions))
+    try:
+        #Every question runs to its end, a failed one does not cancel the others still holding a slot
+        results = await asyncio.gather(*(_ask(question) for question in request.questions), return_exceptions=True)
+    finally:
+        questions_pool.release(len(request.questions))
+
+    answers = []
+    for question, result in zip(request.questions, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error answering {question!r}: {result}")
+            result = AskResponse(question=question, answer="", seconds=0.0, error=str(result) or type(result).__name__)
+        answers.append(result)
+    return BatchResponse(answers=answers)
+
+
+@app.post("/ingest", response_model=IngestResponse)
+async def ingest(files: List[UploadFile] = File(...)):
+    """
+    Ingests PDF files into the Qdrant collections and the lexical index.
+    """
+    from ingest_data import IngestData
+
+    ingest_pool.reserve()
+    try:
+        uploads = [UploadedPDF(upload) for upload in files]
+
+        async with ingest_pool.slot():
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(IngestData(pdf_paths=uploads).load_data_to_db)
+            except RuntimeError as e:
+                raise HTTPException(status_code=500, detail=str(e))
+            return IngestResponse(files=[document.name for document in uploads], seconds=time.perf_counter() - start)
+    finally:
+        ingest_pool.release()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run("api:app", host=os.getenv("API_HOST", "0.0.0.0"), port=int(os.getenv("API_PORT", 8000)),
+                workers=int(os.getenv("API_WORKERS", 1)))
@@ -0,0 +1,85 @@
+import threading
+import asyncio
+import logging
+
+"""
+Event loop persistente del proceso | Process-wide persistent event loop.
+La recuperación asíncrona corre siempre en un único event loop de larga vida, en un hilo de fondo, en lugar
+de crear uno nuevo con asyncio.run en cada pregunta. Los clientes asíncronos (AsyncQdrantClient, gRPC aio)
+quedan ligados al loop que los crea, así que con un solo loop se crean una vez y se reutilizan.
+"""
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLoop:
+    """
+    A long-lived event loop running forever on a daemon thread, started on first use.
+
+    Methods
+    -------
+    loop() -> asyncio.AbstractEventLoop
+        Returns the loop, starting its thread if needed.
+    is_current() -> bool
+        Returns whether the caller runs inside the loop.
+    submit(coroutine) -> concurrent.futures.Future
+        Schedules a coroutine on the loop from any thread.
+    run(coroutine, timeout)
+        Runs a coroutine on the loop and waits for its result, from synchronous code.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                threading.Thread(target=run, name=self.name, daemon=True).start()
+                ready.wait()
+                self._loop = loop
+                logger.info(f"Started the {self.name} event loop")
+            return self._loop
+
+    def is_current(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coroutine):
+        """
+        Schedules a coroutine on the loop from any thread.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future of the result of the coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop())
+
+    def run(self, coroutine, timeout=None):
+        """
+        Runs a coroutine on the loop and waits for its result, from synchronous code.
+
+        Raises
+        ------
+        RuntimeError
+            If it is called from the loop itself, where waiting would block the loop forever.
+        """
+        if self.is_current():
+            coroutine.close()
+            raise RuntimeError(f"Cannot wait for the {self.name} event loop from inside it, await the coroutine instead")
+        return self.submit(coroutine).result(timeout)
+
+
+#Loop único del proceso | Single process-wide loop
+background_loop = BackgroundLoop("async-retrieval")
@@ -0,0 +1,303 @@
+"""
+Benchmark del pipeline RAG sin servicios externos | Offline end-to-end benchmark of the RAG pipeline.
+
+Runs every stage of the pipeline against deterministic stand-ins: a fake chat model instead of
+Gemini/Groq, a hashing embedding provider instead of Gemini embeddings, and Qdrant in local
+in-process mode instead of the Qdrant server. It measures per-stage latency, ingestion chunks/sec
+and memory, and saves the results as JSON so runs of different commits can be compared.
+
+Usage:
+    python benchmark.py --pages 5 20 80 --questions 20 --output bench_results
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import resource
+import io
+
+from dotenv import load_dotenv
+
+#Cargar las variables de entorno | Load environment variables, the stand-ins below override them
+load_dotenv()
+
+#Configure the stand-ins before importing the project modules, they read the environment on import
+_workdir = tempfile.mkdtemp(prefix="rag_bench_")
+os.environ["QDRANT_LOCATION"] = ":memory:"
+#The local Qdrant is not thread-safe within a collection, upload each collection's batches one at a time
+os.environ["UPLOAD_WORKERS"] = "1"
+os.environ["EMBEDDING_PROVIDER"] = "fake"
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(_workdir, "embeddings.sqlite")
+os.environ["INGEST_MANIFEST_PATH"] = os.path.join(_workdir, "ingest_manifest.json")
+os.environ["DIMENSION_REGISTRY_PATH"] = os.path.join(_workdir, "embedding_dimensions.json")
+os.environ["LEXICAL_INDEX_PATH"] = os.path.join(_workdir, "lexical_index.sqlite")
+os.environ["DOCSTORE_PATH"] = os.path.join(_workdir, "docstore.sqlite")
+os.environ["ANSWER_CACHE_GENERATION_PATH"] = os.path.join(_workdir, "answer_cache_generation")
+
+from langchain_core.language_models.chat_models import SimpleChatModel
+from embeddings import EmbeddingProvider, register_embedding_provider
+import llm
+
+WORDS = ("vector database retrieval summary document chunk query answer model latency index "
+         "collection embedding pipeline context question parser stream token budget cache").split()
+
+
+class HashEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic bag-of-words embeddings: every word is hashed into one of `size` buckets.
+    Texts that share words get similar vectors, so retrieval still returns related chunks.
+    """
+
+    def __init__(self, size=256, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.name = f"fake-hash-{size}"
+
+    def _vector(self, text):
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            bucket = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.size
+            vector[bucket] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _embed(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_documents(self, texts):
+        return self._embed(texts)
+
+    def embed_queries(self, texts):
+        return self._embed(texts)
+
+    def dimension(self):
+        return self.size
+
+
+class FakeChatModel(SimpleChatModel):
+    """
+    Deterministic chat model: answers the query-generation prompt with two question variants,
+    and any other prompt with the first words of its last message.
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        text = messages[-1].content if messages else ""
+        match = re.search(r"Original question:\s*(.*)", text)
+        if match:
+            question = match.group(1).strip()
+            return f"{question}, What does the document say about {question}"
+        return " ".join(text.split()[:60])
+
+
+def make_pdf(pages, lines_per_page=40, seed=0):
+    """
+    Builds a minimal PDF with text pages, without any PDF writing dependency.
+
+    Returns
+    -------
+    bytes
+        The content of the PDF file.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = []
+        for line in range(lines_per_page):
+            words = [WORDS[(seed + page * 7 + line * 3 + i) % len(WORDS)] for i in range(12)]
+            lines.append(f"Page {page + 1} line {line + 1}: " + " ".join(words))
+        stream = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({text}) '" for text in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+
+def measure(name, function, repeat=1):
+    """
+    Runs a stage `repeat` times and returns its latency and memory statistics.
+    """
+    latencies = []
+    tracemalloc.start()
+    result = None
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            latencies.append(time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    latencies.sort()
+    stats = {
+        "stage": name,
+        "runs": repeat,
+        "mean_s": sum(latencies) / len(latencies),
+        "p50_s": latencies[len(latencies) // 2],
+        "p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "max_s": latencies[-1],
+        "peak_python_mb": peak / 2 ** 20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print(f"{name:<40} mean {stats['mean_s'] * 1000:9.2f} ms  p95 {stats['p95_s'] * 1000:9.2f} ms  "
+          f"peak {stats['peak_python_mb']:7.1f} MB")
+    return stats, result
+
+
+def reset_caches():
+    """
+    Empties the embedding cache and invalidates the answer cache, so the next stage starts cold.
+    """
+    from embedding_cache import embedding_cache
+    from answer_cache import answer_cache
+    embedding_cache.clear()
+    answer_cache.invalidate()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    register_embedding_provider("fake", HashEmbeddingProvider(latency=args.embedding_latency))
+    fake_llm = FakeChatModel(latency=args.llm_latency)
+    llm.LLM.init_llm = lambda self: fake_llm
+    llm.LLM.response_llm = lambda self: fake_llm
+
+    from ingest_data import IngestData
+    from consult_db import ConsultDB
+    from retriever import Retriever_QA
+
+    results = {"commit": git_commit(), "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "config": vars(args), "stages": []}
+
+    #1.Ingestion of generated PDFs of growing size
+    for pages in args.pages:
+        upload = io.BytesIO(make_pdf(pages, seed=pages))
+        upload.name = f"bench_{pages}_pages.pdf"
+        ingest = IngestData(pdf_paths=[upload])
+        stats, _ = measure(f"ingest ({pages} pages)", ingest.load_data_to_db)
+        chunks = len(ingest.splittext(ingest_pages(upload)))
+        stats["pages"] = pages
+        stats["split_chunks"] = chunks
+        stats["chunks_per_sec"] = chunks / stats["mean_s"] if stats["mean_s"] else 0.0
+        results["stages"].append(stats)
+
+        #Same size, streamed page by page from the buffer
+        upload = io.BytesIO(make_pdf(pages, seed=pages + 1))
+        upload.name = f"bench_{pages}_pages_streaming.pdf"
+        os.environ["INGEST_STREAMING"] = "true"
+        try:
+            ingest = IngestData(pdf_paths=[upload])
+        finally:
+            os.environ.pop("INGEST_STREAMING")
+        stats, _ = measure(f"ingest streaming ({pages} pages)", ingest.load_data_to_db)
+        stats["pages"] = pages
+        stats["split_chunks"] = chunks
+        stats["chunks_per_sec"] = chunks / stats["mean_s"] if stats["mean_s"] else 0.0
+        results["stages"].append(stats)
+
+    questions = [f"What is the {WORDS[i % len(WORDS)]} of the {WORDS[(i * 5) % len(WORDS)]}?"
+                 for i in range(args.questions)]
+    counter = [0]
+
+    def next_question():
+        counter[0] += 1
+        return questions[(counter[0] - 1) % len(questions)]
+
+    def measure_cold_and_warm(name, function):
+        #The same questions run twice: from empty caches, then again with the caches the first run filled
+        for caches in ("cold", "warm"):
+            if caches == "cold":
+                reset_caches()
+            counter[0] = 0
+            stats, _ = measure(f"{name} ({caches})", function, args.questions)
+            stats["caches"] = caches
+            results["stages"].append(stats)
+
+    #2.Query generation
+    measure_cold_and_warm("Retriever_QA.generate_questions",
+                          lambda: Retriever_QA(question=next_question()).generate_questions())
+
+    #3.Retrieval, sync and async
+    measure_cold_and_warm("ConsultDB.get_all_document",
+                          lambda: ConsultDB(questions=[next_question(), next_question()]).get_all_document())
+    measure_cold_and_warm("ConsultDB.get_all_document_async",
+                          lambda: ConsultDB(questions=[next_question(), next_question()]).get_all_document_async())
+
+    #4.Full question answering chain
+    try:
+        from chatbot import Chatbot
+    except Exception as e:
+        print(f"Skipping Chatbot.input: {e}")
+        results["stages"].append({"stage": "Chatbot.input", "skipped": str(e)})
+    else:
+        measure_cold_and_warm("Chatbot.input", lambda: Chatbot(question=next_question()).input())
+
+    from metrics import metrics
+    results["metrics"] = metrics.snapshot()
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{time.strftime('%Y%m%d-%H%M%S')}_{results['commit'] or 'nogit'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Results saved in {path}")
+    return results
+
+
+def ingest_pages(upload):
+    """
+    Parses an uploaded PDF again, only to count its chunks.
+    """
+    from ingest_data import parse_pdf
+    upload.seek(0)
+    return parse_pdf(upload.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the RAG pipeline")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 80], help="Pages of each generated PDF")
+    parser.add_argument("--questions", type=int, default=20, help="Runs of each query stage")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per LLM call")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Simulated seconds per embedding call")
+    parser.add_argument("--output", default="bench_results", help="Folder of the JSON results")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
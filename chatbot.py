@@ -0,0 +1,323 @@
+from langchain.globals import set_verbose, set_debug
+from langchain_core.output_parsers import StrOutputParser
+from langchain.schema.runnable import RunnablePassthrough
+from langchain.text_splitter import CharacterTextSplitter
+from consult_db import ConsultDB
+from retriever import Retriever_QA
+from llm import LLM
+from prompt import Prompt
+from answer_cache import answer_cache
+from context_builder import ContextBuilder
+from metrics import metrics
+from singleflight import answer_flight, normalize
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+#Hilos para generar las preguntas mientras se busca la pregunta original | Threads that generate the questions while the original question is searched
+_query_generation_pool = ThreadPoolExecutor(max_workers=int(os.getenv("QUERY_GENERATION_WORKERS", 4)),
+                                            thread_name_prefix="query-generation")
+#Hilos propios para el embedding de la caché de respuestas | Own threads for the answer cache embedding,
+#so it never queues behind query generations that outlived their deadline
+_question_embedding_pool = ThreadPoolExecutor(max_workers=int(os.getenv("QUESTION_EMBEDDING_WORKERS", 4)),
+                                              thread_name_prefix="question-embedding")
+
+
+class Chatbot(Retriever_QA, ConsultDB, LLM, Prompt):
+    """
+    A class used to create a chatbot that processes a user's question, generates related questions, retrieves documents from a database, and provides an answer.
+
+    Attributes
+    ----------
+    question : str
+        The user's question to be processed.
+    retriever : Retriever_QA
+        An instance of the Retriever_QA class to generate related questions.
+    db_consultant : ConsultDB
+        An instance of the ConsultDB class to retrieve documents from the database.
+    text_splitter : CharacterTextSplitter
+        An instance of the CharacterTextSplitter class to split text into chunks.
+    context_builder : ContextBuilder
+        An instance of the ContextBuilder class to merge, deduplicate and trim the retrieved documents.
+    context : list
+        The documents used as context for the last answer.
+
+    Methods
+    -------
+    input() -> str
+        Processes the user's question through a pipeline to generate related questions, retrieve documents, and provide an answer.
+    stream() -> Iterator[str]
+        Same pipeline as `input`, yielding the answer token by token.
+    """
+    
+    def __init__(self, question):
+        """
+        Constructs all the necessary attributes for the Chatbot object.
+
+        Parameters
+        ----------
+        question : str
+            The user's question to be processed.
+        """
+        self.question = question
+        LLM.__init__(self)
+        self.retriever = Retriever_QA(question)
+        self.db_consultant = ConsultDB([question])
+        self.text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        self.context_builder = ContextBuilder(token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000)),
+                                              expand_parents=os.getenv("CONTEXT_EXPAND_PARENTS", "false").lower() == "true")
+        self.context = None
+        #Opt-in: on a deadline the answer may be built from the original question only
+        self.speculative_retrieval = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+        if self.speculative_retrieval and "QUERY_GENERATION_MODEL" not in os.environ:
+            #The variants are generated with the fast model, so they usually arrive before the deadline
+            self.retriever.query_model = "response"
+        self.query_generation_timeout = float(os.getenv("QUERY_GENERATION_TIMEOUT", 15.0))
+
+
+    def _configure_debug(self):
+        """
+        Activates the LangChain verbose and debug modes, only if LANGCHAIN_DEBUG is "true".
+
+        The debug mode logs every prompt in full, so it is kept off the hot path unless it is asked for.
+        """
+        if os.getenv("LANGCHAIN_DEBUG", "false").lower() != "true":
+            return
+
+        #get information from the pipeline
+        set_verbose(True)
+                #activate mode debug, use to it can identy problems
+        set_debug(True)
+
+    def _question_vector(self):
+        """
+        Embeds the user's question for the answer cache, within the query embedding deadline.
+
+        Returns
+        -------
+        list of float or None
+            The vector, or None if the embedding failed or was too slow, then the answer cache is skipped
+            and the retrieval falls back to the lexical index.
+        """
+        future = _question_embedding_pool.submit(self.db_consultant.embed_questions, [self.question])
+        try:
+            return future.result(timeout=self.db_consultant.embedding_timeout)[0]
+        except Exception as e:
+            logger.warning(f"Could not embed the question for the answer cache: {str(e) or 'timed out'}")
+            return None
+
+    def _merge_questions(self, questions_generated):
+        """
+        Puts the original question first and drops empty and repeated questions.
+
+        The comma separated output parser can split or drop the original question, so it is always added back.
+        """
+        questions = []
+        seen = set()
+        for question in [self.question, *questions_generated]:
+            key = " ".join(str(question).split()).lower()
+            if key and key not in seen:
+                seen.add(key)
+                questions.append(question)
+        return questions
+
+    def _speculative_retrieval(self):
+        """
+        Searches the original question right away while the question variants are generated,
+        then adds the results of the variants if they arrive before QUERY_GENERATION_TIMEOUT.
+
+        Returns
+        -------
+        list of dict
+            The documents of the original question, followed by the documents of the variants.
+        """
+        def generate():
+            with metrics.timer("rag_stage_seconds", stage="query_generation"):
+                return self.retriever.generate_questions()
+
+        start = time.perf_counter()
+        future = _query_generation_pool.submit(generate)
+
+        retrieve = self.db_consultant
+        retrieve.questions = [self.question]
+        with metrics.timer("rag_stage_seconds", stage="retrieval_original"):
+            documents = retrieve.get_all_document_async()
+
+        #Wait for the variants only until the deadline, then answer with the results we have
+        remaining = max(0.0, self.query_generation_timeout - (time.perf_counter() - start))
+        try:
+            questions_generated = future.result(timeout=remaining)
+        except FuturesTimeout:
+            metrics.increment("query_generation_deadline_exceeded_total")
+            logger.warning(f"Query generation took more than {self.query_generation_timeout}s, answering with the original question")
+            return documents
+        except Exception as e:
+            metrics.increment("query_generation_failures_total")
+            logger.warning(f"Query generation failed, answering with the original question: {e}")
+            return documents
+
+        variants = self._merge_questions(questions_generated)[1:]
+        if variants:
+            retrieve.questions = variants
+            with metrics.timer("rag_stage_seconds", stage="retrieval"):
+                documents = documents + retrieve.get_all_document_async()
+        return documents
+
+    def _build_chain(self):
+        """
+        Generates the related questions, retrieves their documents and builds the answer chain.
+
+        Returns
+        -------
+        tuple
+            The answer chain, its input dictionary and the documents of the assembled context.
+        """
+        if self.speculative_retrieval:
+            #1-2.Search the original question while its variants are generated
+            documents = self._speculative_retrieval()
+        else:
+            #1.Get different questions using as templete the user's question 
+            with metrics.timer("rag_stage_seconds", stage="query_generation"):
+                questions_generated = self.retriever.generate_questions()
+
+            #2.Get the documents in the database, reusing the consultant built for the question
+            retrieve = self.db_consultant
+            retrieve.questions = self._merge_questions(questions_generated)
+            #Every (question x collection) search runs at once, the latency is set by the slowest search
+            with metrics.timer("rag_stage_seconds", stage="retrieval"):
+                documents = retrieve.get_all_document_async()
+
+        #3.Merge the results of every question and collection, drop repeated chunks and fit the token budget
+        with metrics.timer("rag_stage_seconds", stage="context_assembly"):
+            documents = self.context_builder.build(documents)
+            context = self.context_builder.format(documents)
+
+        #4.Get the shared llm client from the model registry
+        llm=self.init_llm()
+        
+        #5.Run the process chain to can get the answer the user's question
+        final_rag_chain=(
+            RunnablePassthrough(lambda x: {"context": context, "question": x}) #get object runnable to be able to join the runnableSecuence of the pipeline final rag_chain
+            |self.prompt_answer(context=context, question=self.question) #call prompt QA using the questions generated
+            |llm #load the llm model to Groq
+            |StrOutputParser())
+        
+        # Create a dictionary with context and question
+        input_dict = {
+            "context": context,
+            "question": self.question
+    }
+        return final_rag_chain, input_dict, documents
+
+    def input(self,):
+        """
+        Processes the user's question through a pipeline to generate related questions, retrieve documents, and provide an answer.
+
+        Returns
+        -------
+        str
+            The answer to the user's question. The documents used as context are kept in `self.context`.
+        """
+        self._configure_debug()
+
+        #0.Return the stored answer if a semantically similar question was already answered
+        question_vector = self._question_vector()
+        generation = answer_cache.generation
+        cached = answer_cache.lookup(question_vector) if question_vector is not None else None
+        if cached is not None:
+            metrics.increment("answer_cache_hits_total")
+            self.context = cached["context"]
+            return cached["answer"]
+
+        #Concurrent requests with the same question share one pipeline run and all get its answer
+        answer, documents = answer_flight.do(normalize(self.question), self._answer, question_vector, generation)
+        self.context = documents
+        metrics.export()
+        return answer
+
+    def _answer(self, question_vector, generation):
+        """
+        Runs the pipeline and stores the answer in the answer cache.
+
+        Returns
+        -------
+        tuple
+            The answer and the documents of its context.
+        """
+        logger.info("Starting the pipeline to get the answer of the questions of the user")
+        final_rag_chain, input_dict, documents = self._build_chain()
+
+        start = time.perf_counter()
+        answer = final_rag_chain.invoke(input_dict)
+        metrics.observe("rag_stage_seconds", time.perf_counter() - start, stage="llm_answer")
+        logger.info(f"Finishing the pipeline to get the answer of the questions of the user, answer in {time.perf_counter() - start:.3f}s") 
+
+        #Store the answer, it is skipped if new documents were ingested while it was generated
+        if question_vector is not None:
+            answer_cache.store(question_vector, self.question, answer, documents, generation=generation)
+        return answer, documents
+
+    def stream(self):
+        """
+        Processes the user's question like `input`, but yields the answer token by token as the LLM generates it.
+
+        The time to the first token and the total answer time are logged separately.
+
+        Yields
+        ------
+        str
+            The next piece of the answer to the user's question.
+        """
+        self._configure_debug()
+
+        question_vector = self._question_vector()
+        generation = answer_cache.generation
+        cached = answer_cache.lookup(question_vector) if question_vector is not None else None
+        if cached is not None:
+            metrics.increment("answer_cache_hits_total")
+            self.context = cached["context"]
+            yield cached["answer"]
+            return
+
+        #Concurrent requests with the same question share one answer stream, the followers replay its tokens
+        documents = yield from answer_flight.stream(normalize(self.question), self._stream_answer, question_vector, generation)
+        self.context = documents
+        metrics.export()
+
+    def _stream_answer(self, question_vector, generation):
+        """
+        Runs the pipeline streaming the answer, and stores it in the answer cache.
+
+        Yields
+        ------
+        str
+            The next piece of the answer.
+
+        Returns
+        -------
+        list
+            The documents of the context of the answer.
+        """
+        logger.info("Starting the streaming pipeline to get the answer of the questions of the user")
+        final_rag_chain, input_dict, documents = self._build_chain()
+
+        #Stream the tokens of the LLM through the StrOutputParser
+        start = time.perf_counter()
+        first_token = None
+        tokens = []
+        for token in final_rag_chain.stream(input_dict):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+                metrics.observe("rag_stage_seconds", first_token, stage="llm_first_token")
+                logger.info(f"Time to first token: {first_token:.3f}s")
+            tokens.append(token)
+            yield token
+        metrics.observe("rag_stage_seconds", time.perf_counter() - start, stage="llm_answer")
+        logger.info(f"Finishing the streaming pipeline, answer in {time.perf_counter() - start:.3f}s")
+
+        if question_vector is not None:
+            answer_cache.store(question_vector, self.question, "".join(tokens), documents, generation=generation)
+        return documents
@@ -0,0 +1,95 @@
+"""
+Presupuesto de tiempo de importación | Import-time budget check.
+
+Imports each entry module in a fresh interpreter, several times, and fails when the median
+import time goes over its budget or when a module cannot be imported. With --profile it also lists the slowest imports reported by
+`python -X importtime`, to find what a slow start is loading.
+
+Usage:
+    python check_import_time.py --modules chatbot ingest_data --budget 3.0 --runs 3 --profile 10
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+import os
+
+DEFAULT_MODULES = ["chatbot", "ingest_data", "consult_db", "main"]
+#The modules are imported from the repository, wherever the check is run from
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _environment():
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_DIR, environment.get("PYTHONPATH")]))
+    return environment
+
+
+def time_import(module, runs):
+    """
+    Imports a module in `runs` fresh interpreters and returns the wall time of each one, in seconds.
+    """
+    code = (f"import time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start)")
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=REPO_DIR, env=_environment())
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+            raise RuntimeError(error)
+        try:
+            timings.append(float(result.stdout.strip().splitlines()[-1]))
+        except (ValueError, IndexError):
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def slowest_imports(module, top):
+    """
+    Returns the `top` imports with the largest cumulative time, from `python -X importtime`.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=REPO_DIR, env=_environment())
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        #"import time: <self us> | <cumulative us> | <module>"
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the entry modules against a budget")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET", 3.0)),
+                        help="Maximum median import time of each module, in seconds")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh imports of each module")
+    parser.add_argument("--profile", type=int, default=0, help="List the N slowest imports of each module")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        try:
+            timings = time_import(module, args.runs)
+        except RuntimeError as e:
+            #A broken import is a failure, not a module that fits the budget
+            print(f"{module:<15} FAILED   could not import it: {e}")
+            failed = True
+            continue
+        median = statistics.median(timings)
+        status = "OK" if median <= args.budget else "OVER"
+        failed = failed or status == "OVER"
+        print(f"{module:<15} {status:<8} median {median:6.2f} s  budget {args.budget:.2f} s")
+        for cumulative_us, name in slowest_imports(module, args.profile) if args.profile else []:
+            print(f"    {cumulative_us / 1e6:6.2f} s  {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,18 @@
 from langchain.schema.runnable import RunnableParallel
-import google.generativeai as gemini_client
 from langchain.schema import Document
 from db import VectorDB
+from embedding_cache import embedding_cache
+from lexical_index import lexical_index
+from singleflight import embedding_flight, search_flight, normalize, vector_key
+from metrics import metrics
+from async_loop import background_loop
 from typing import List, Dict
-import google.generativeai as genai
-from dotenv import load_dotenv
+import asyncio
+import logging
+import time
 import os
 
-#Cargar las variables de entorno | Load environment variables
-load_dotenv()
-
-#Cargar el api_key de google gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+logger = logging.getLogger(__name__)
 
 
 class ConsultDB( VectorDB):
@@ -23,16 +24,36 @@ class ConsultDB( VectorDB):
     questions : list of str
         A list of questions to query the database.
     model : str
-        The model used for generating embeddings.
+        The model used for generating embeddings, given by the shared embedding provider.
+    collections : dict
+        The collections searched for each question, mapped to the key used in the results.
+    max_concurrency : int
+        Maximum number of collection searches running at once in the async path.
+    search_timeout : float
+        Seconds each collection search may take in the async path before it is dropped.
+    lexical_search_enabled : bool
+        Whether the local BM25 index is searched too, and used alone when the embeddings fail.
+    embedding_timeout : float
+        Seconds the query embedding may take in the async path before only the lexical results are used.
 
     Methods
     -------
-    _search_collection(collection_name: str, question: str) -> List[Document]
+    embed_questions(questions: List[str]) -> List[List[float]]
+        Embeds all the questions in one batched embedding request.
+    lexical_search(question: str) -> List[Document]
+        Searches the local BM25 index of the split chunks, without embedding the question.
+    _search_collection(collection_name: str, question: str, query_vector: List[float]) -> List[Document]
         Searches for documents in a specified collection related to a given question.
     query_parallel(input) -> Dict[str, List[Document]]
         Searches for documents in parallel across multiple collections related to the input question.
     get_all_document() -> List[Dict[str, List[Document]]]
         Retrieves all documents related to the list of questions.
+    aembed_questions(questions: List[str]) -> List[List[float]]
+        Asynchronously embeds all the questions in one batched embedding request.
+    aget_all_document() -> List[Dict[str, List[Document]]]
+        Asynchronously retrieves all documents, launching every (question x collection) search at once.
+    get_all_document_async() -> List[Dict[str, List[Document]]]
+        Runs `aget_all_document` from synchronous code, on the process-wide background event loop.
     """
 
     def __init__(self, questions:list[str]):
@@ -46,10 +67,59 @@ class ConsultDB( VectorDB):
         """
 
         self.questions = questions
-        self.model="models/embedding-001" # "sentence-transformers/all-MiniLM-L6-v2" #"models/embedding-001"            
+        #The embedding model comes from the provider chosen with EMBEDDING_PROVIDER ("gemini" or "local")
         super().__init__(text=None)    
+        self.collections = {'Summary': 'summaries', 'Splited_text': 'splits'} #'Documents': 'original'
+        self.max_concurrency = int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", 8))
+        self.search_timeout = float(os.getenv("RETRIEVAL_SEARCH_TIMEOUT", 10.0))
+        self.lexical_search_enabled = os.getenv("LEXICAL_SEARCH", "true").lower() == "true"
+        self.embedding_timeout = float(os.getenv("QUERY_EMBEDDING_TIMEOUT", 3.0))
+
+    def embed_questions(self, questions: List[str]) -> List[List[float]]:
+        """
+        Embeds all the questions in one batched embedding request.
+
+        Parameters
+        ----------
+        questions : list of str
+            The questions to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One query vector per question, in the same order as the questions.
+        """
 
-    def _search_collection(self, collection_name: str, question:str) -> List[Document]:
+        if not questions:
+            return []
+
+        #Repeated questions are served from the embedding cache, only the misses are embedded, in one batch
+        vectors = embedding_cache.get_many(self.model, "retrieval_query", questions)
+        missing = [question for question, vector in zip(questions, vectors) if vector is None]
+        metrics.increment("query_embedding_cache_hits_total", len(questions) - len(missing))
+        if missing:
+            #Concurrent requests embedding the same questions share one embedding call
+            with metrics.timer("rag_stage_seconds", stage="query_embedding"):
+                embedded = embedding_flight.do(self._embedding_key(missing), self.embedding_provider.embed_queries, missing)
+            embedding_cache.set_many(self.model, "retrieval_query", missing, embedded)
+            vectors = self._fill_missing(vectors, embedded)
+        return vectors
+
+    def _embedding_key(self, questions):
+        return self.model, tuple(normalize(question) for question in questions)
+
+    def _search_key(self, collection_name, query_vector):
+        return collection_name, vector_key(query_vector), self.search_params["top_k"], repr(self.get_search_params())
+
+    @staticmethod
+    def _fill_missing(vectors, embedded):
+        """
+        Places the newly embedded vectors in the positions that were not cached.
+        """
+        embedded = iter(embedded)
+        return [vector if vector is not None else next(embedded) for vector in vectors]
+
+    def _search_collection(self, collection_name: str, question:str=None, query_vector:List[float]=None) -> List[Document]:
         """
         Searches for documents in a specified collection related to a given question.
 
@@ -57,8 +127,10 @@ class ConsultDB( VectorDB):
         ----------
         collection_name : str
             The name of the collection to search in.
-        question : str
-            The question to query the collection with.
+        question : str, optional
+            The question to query the collection with. Only embedded if `query_vector` is not given.
+        query_vector : list of float, optional
+            The precomputed embedding of the question.
 
         Returns
         -------
@@ -69,29 +141,70 @@ class ConsultDB( VectorDB):
         #load Qdrant client
         client = self.check_connection_qdrant()
 
-        #Configure the api_key of google gemini
-        gemini_client.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        #Embed the question only if the caller did not already do it
+        if query_vector is None:
+            query_vector = self.embed_questions([question])[0]
 
         #Searching for document in Qdrant
-        results=client.search(
-            collection_name=collection_name,
-            query_vector=gemini_client.embed_content(
-                model=self.model,
-                content=question,
-                task_type="retrieval_query",  #this is it can recover this information
-                )["embedding"],
-        )
-        return [Document(page_content=result.payload['page_content'], metadata={"score": result.score, "collection": collection_name}) 
-                for result in results]
+        #Concurrent requests with the same vector share one search
+        with metrics.timer("rag_stage_seconds", stage="search", collection=collection_name):
+            results=search_flight.do(
+                self._search_key(collection_name, query_vector),
+                client.search,
+                collection_name=collection_name,
+                query_vector=query_vector,
+                limit=self.search_params["top_k"],
+                search_params=self.get_search_params(),
+            )
+        return self._to_documents(results, collection_name)
+
+    @staticmethod
+    def _to_documents(results, collection_name: str) -> List[Document]:
+        """
+        Converts the Qdrant search results into documents with their score and collection.
+        """
+        documents = []
+        for result in results:
+            metadata = result.payload.get('metadata') or {}
+            documents.append(Document(page_content=result.payload['page_content'], metadata={
+                "score": result.score, "collection": collection_name, "source": metadata.get("source"),
+                "page": metadata.get("page"), "parent_id": metadata.get("parent_id")}))
+        return documents
     
+    def lexical_search(self, question: str) -> List[Document]:
+        """
+        Searches the local BM25 index of the split chunks, without embedding the question.
+
+        Returns
+        -------
+        List[Document]
+            The best chunks with their BM25 score, in the 'Lexical' collection.
+        """
+        with metrics.timer("rag_stage_seconds", stage="lexical_search"):
+            results = lexical_index.search(question, limit=self.search_params["top_k"])
+        return [Document(page_content=result["text"], metadata={"score": result["score"], "collection": "Lexical",
+                                                                "source": result["source"], "page": result["page"]})
+                for result in results]
+
+    def _lexical_fallback(self, reason):
+        """
+        Answers every question with the lexical index alone, when the embeddings are not available.
+        """
+        if not self.lexical_search_enabled:
+            return None
+        metrics.increment("lexical_fallback_total")
+        logger.warning(f"Query embedding {reason}, using only the lexical index")
+        return [{"lexical": self.lexical_search(question)} for question in self.questions]
+
     def query_parallel(self, input) -> Dict[str, List[Document]]:
         """
         Searches for documents in parallel across multiple collections related to the input question.
 
         Parameters
         ----------
-        input : str
-            The input question to query the collections with.
+        input : str or dict
+            The input question to query the collections with, or a dictionary with the
+            `question` and its precomputed `vector`, so the same vector is reused in every collection.
 
         Returns
         -------
@@ -99,11 +212,16 @@ class ConsultDB( VectorDB):
             A dictionary with collection names as keys and lists of related documents as values.
         """
 
+        #Embed the question once and share the vector with every collection search
+        if not isinstance(input, dict):
+            input = {"question": input, "vector": self.embed_questions([input])[0]}
+
         #Search parallel in the collections the documents related to the question's user 
         parallel_search = RunnableParallel(
-            #original=lambda x: self._search_collection('Documents',  question=x),
-            summaries=lambda x: self._search_collection('Summary',  question=x),
-            splits=lambda x: self._search_collection('Splited_text',  question=x)
+            #original=lambda x: self._search_collection('Documents',  question=x["question"], query_vector=x["vector"]),
+            summaries=lambda x: self._search_collection('Summary',  question=x["question"], query_vector=x["vector"]),
+            splits=lambda x: self._search_collection('Splited_text',  question=x["question"], query_vector=x["vector"]),
+            **({"lexical": lambda x: self.lexical_search(x["question"])} if self.lexical_search_enabled else {}),
         )
         
         return parallel_search.invoke(input)
@@ -121,9 +239,154 @@ class ConsultDB( VectorDB):
         #Create a list where it gonna store all the documents
         list_documents=[]
 
+        #Embed every question derivated of the user's question in a single batched request
+        try:
+            vectors = self.embed_questions(self.questions)
+        except Exception as e:
+            fallback = self._lexical_fallback(f"failed: {e}")
+            if fallback is None:
+                raise
+            return fallback
+
         #interate over the list of questions derivated of the user's question, so get documents of the Qdrant database
-        for question in self.questions:
+        for question, vector in zip(self.questions, vectors):
             #call the method query_parallel
-            documents=self.query_parallel(input=question)
+            documents=self.query_parallel(input={"question": question, "vector": vector})
             list_documents.append(documents)
-        return list_documents
\ No newline at end of file
+        return list_documents
+
+    async def aembed_questions(self, questions: List[str]) -> List[List[float]]:
+        """
+        Asynchronously embeds all the questions in one batched embedding request.
+
+        Parameters
+        ----------
+        questions : list of str
+            The questions to embed.
+
+        Returns
+        -------
+        List[List[float]]
+            One query vector per question, in the same order as the questions.
+        """
+
+        if not questions:
+            return []
+
+        #The cache reads and writes SQLite, off the event loop
+        vectors = await asyncio.to_thread(embedding_cache.get_many, self.model, "retrieval_query", questions)
+        missing = [question for question, vector in zip(questions, vectors) if vector is None]
+        metrics.increment("query_embedding_cache_hits_total", len(questions) - len(missing))
+        if missing:
+            with metrics.timer("rag_stage_seconds", stage="query_embedding"):
+                embedded = await embedding_flight.ado(self._embedding_key(missing), self.embedding_provider.aembed_queries, missing)
+            await asyncio.to_thread(embedding_cache.set_many, self.model, "retrieval_query", missing, embedded)
+            vectors = self._fill_missing(vectors, embedded)
+        return vectors
+
+    async def _asearch_collection(self, client, semaphore, collection_name: str, query_vector: List[float]) -> List[Document]:
+        """
+        Asynchronously searches one collection, bounded by the shared semaphore and the search timeout.
+
+        Returns
+        -------
+        List[Document]
+            A list of documents related to the question.
+        """
+
+        search = dict(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            limit=self.search_params["top_k"],
+            search_params=self.get_search_params(),
+        )
+        async def run_search():
+            #The local in-process mode has no async client, its searches run on worker threads
+            if self.location:
+                return await asyncio.to_thread(client.search, **search)
+            return await client.search(**search)
+
+        async with semaphore:
+            #Concurrent requests with the same vector share one search
+            pending = search_flight.ado(self._search_key(collection_name, query_vector), run_search)
+            with metrics.timer("rag_stage_seconds", stage="search", collection=collection_name):
+                results = await asyncio.wait_for(pending, timeout=self.search_timeout)
+        return self._to_documents(results, collection_name)
+
+    async def aget_all_document(self):
+        """
+        Asynchronously retrieves all documents related to the list of questions.
+
+        Every (question x collection) search is launched at the same time, with at most
+        `max_concurrency` running at once and each one limited to `search_timeout` seconds.
+        A search that fails or times out is logged and returns no documents, so the other
+        results are still returned. The local lexical index is searched for every question too, and
+        if the query embedding fails or takes more than `embedding_timeout` only its results are returned.
+
+        The searches always run on the process-wide background event loop, where the async clients live;
+        awaited from another loop, the work is handed over to it.
+
+        Returns
+        -------
+        List[Dict[str, List[Document]]]
+            A list of dictionaries with collection names as keys and lists of related documents as values.
+        """
+        if not background_loop.is_current():
+            return await asyncio.wrap_future(background_loop.submit(self.aget_all_document()))
+
+        start = time.perf_counter()
+        try:
+            vectors = await asyncio.wait_for(self.aembed_questions(self.questions), timeout=self.embedding_timeout)
+        except Exception as e:
+            reason = f"took more than {self.embedding_timeout}s" if isinstance(e, asyncio.TimeoutError) else f"failed: {e}"
+            fallback = await asyncio.to_thread(self._lexical_fallback, reason)
+            if fallback is None:
+                raise
+            return fallback
+
+        client = self.check_connection_qdrant() if self.location else self.check_connection_qdrant_async()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        #Launch every (question x collection) search at once
+        searches = [
+            (index, key, self._asearch_collection(client, semaphore, collection, vector))
+            for index, vector in enumerate(vectors)
+            for collection, key in self.collections.items()
+        ]
+        #The lexical index is searched on a worker thread while the dense searches run
+        lexical = (asyncio.ensure_future(asyncio.to_thread(lambda: [self.lexical_search(question) for question in self.questions]))
+                   if self.lexical_search_enabled else None)
+        results = await asyncio.gather(*(search for _, _, search in searches), return_exceptions=True)
+
+        list_documents = [{key: [] for key in self.collections.values()} for _ in self.questions]
+        for (index, key, _), result in zip(searches, results):
+            if isinstance(result, BaseException):
+                #Partial results: a slow or failed search does not break the whole retrieval
+                reason = "timed out" if isinstance(result, asyncio.TimeoutError) else f"failed: {result}"
+                metrics.increment("search_failures_total", collection=key)
+                logger.warning(f"Search '{key}' for question '{self.questions[index]}' {reason}")
+                continue
+            list_documents[index][key] = result
+
+        #The lexical results are fused with the dense ones when the context is assembled
+        if lexical is not None:
+            for index, documents in enumerate(await lexical):
+                list_documents[index]["lexical"] = documents
+
+        logger.info(f"Async retrieval of {len(searches)} searches in {time.perf_counter() - start:.3f}s")
+        return list_documents
+
+    def get_all_document_async(self):
+        """
+        Runs `aget_all_document` from synchronous code.
+
+        It runs on the process-wide background event loop instead of a new loop per call, so the async
+        Qdrant client and its connections are reused by every request. Callers that already run inside
+        an event loop must await `aget_all_document` directly.
+
+        Returns
+        -------
+        List[Dict[str, List[Document]]]
+            A list of dictionaries with collection names as keys and lists of related documents as values.
+        """
+        return background_loop.run(self.aget_all_document())
@@ -0,0 +1,168 @@
+from langchain.schema import Document
+from typing import List, Dict
+from tokens import count_tokens
+from docstore import docstore, parent_id
+import hashlib
+import logging
+
+"""
+Ensamblado del contexto | Context assembly.
+Une los documentos recuperados para todas las preguntas generadas y todas las colecciones con
+reciprocal rank fusion, elimina los fragmentos repetidos y recorta el contexto a un presupuesto de tokens
+antes de pasarlo al prompt de respuesta.
+"""
+logger = logging.getLogger(__name__)
+
+
+class ContextBuilder:
+    """
+    A class used to merge, deduplicate and trim the retrieved documents into the answer context.
+
+    Attributes
+    ----------
+    token_budget : int
+        Maximum number of tokens of the assembled context.
+    rrf_k : int
+        Constant of the reciprocal rank fusion, larger values flatten the weight of the top ranks.
+    expand_parents : bool
+        Whether the matched chunks are replaced by their full page from the parent-document store.
+
+    Methods
+    -------
+    fuse(list_documents: List[Dict[str, List[Document]]]) -> List[Document]
+        Merges the ranked lists with reciprocal rank fusion and drops duplicate chunks.
+    expand(documents: List[Document]) -> List[Document]
+        Replaces the chunks by their full page, keeping each page once at its best rank.
+    build(list_documents: List[Dict[str, List[Document]]]) -> List[Document]
+        Fuses the documents and keeps the best ones that fit in the token budget.
+    format(documents: List[Document]) -> str
+        Joins the documents into the text placed in the prompt.
+    """
+
+    #Separador entre documentos del contexto | Separator between the documents of the context
+    SEPARATOR = "\n\n"
+
+    def __init__(self, token_budget=3000, rrf_k=60, expand_parents=False):
+        """
+        Constructs all the necessary attributes for the ContextBuilder object.
+
+        Parameters
+        ----------
+        token_budget : int, optional
+            Maximum number of tokens of the assembled context (default is 3000).
+        rrf_k : int, optional
+            Constant of the reciprocal rank fusion (default is 60).
+        expand_parents : bool, optional
+            Replace the matched chunks by their full page (default is False).
+        """
+        self.token_budget = token_budget
+        self.rrf_k = rrf_k
+        self.expand_parents = expand_parents
+
+    @staticmethod
+    def _entry(index: int, doc: Document) -> str:
+        #The text of one document in the prompt, with its rank and collection
+        return f"[{index}] ({doc.metadata.get('collection', '')}) {doc.page_content}"
+
+    @staticmethod
+    def _content_key(text: str) -> str:
+        return hashlib.sha1(" ".join(text.split()).lower().encode("utf-8")).hexdigest()
+
+    def fuse(self, list_documents: List[Dict[str, List[Document]]]) -> List[Document]:
+        """
+        Merges the ranked lists with reciprocal rank fusion and drops duplicate chunks.
+
+        Each (question x collection) result list is ranked by the Qdrant score stored in the metadata.
+        A chunk found by several lists adds up their reciprocal ranks and appears once.
+
+        Parameters
+        ----------
+        list_documents : list of dict
+            The result of `ConsultDB.get_all_document`, one dictionary of ranked lists per question.
+
+        Returns
+        -------
+        List[Document]
+            The unique documents sorted by their fused score, stored in `metadata["rrf_score"]`.
+        """
+        fused = {}
+        for results in list_documents:
+            for ranked in results.values():
+                ranked = sorted(ranked, key=lambda doc: doc.metadata.get("score", 0.0), reverse=True)
+                for rank, doc in enumerate(ranked, start=1):
+                    key = self._content_key(doc.page_content)
+                    if key not in fused:
+                        fused[key] = [doc, 0.0]
+                    fused[key][1] += 1.0 / (self.rrf_k + rank)
+
+        documents = []
+        for doc, score in sorted(fused.values(), key=lambda item: item[1], reverse=True):
+            documents.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "rrf_score": score}))
+        return documents
+
+    @staticmethod
+    def _parent_id(doc: Document):
+        if doc.metadata.get("parent_id"):
+            return doc.metadata["parent_id"]
+        #Chunks stored before the parent-document mode still know their source and page
+        if doc.metadata.get("collection") in ("Splited_text", "Lexical") and doc.metadata.get("page") is not None:
+            return parent_id(doc.metadata.get("source"), doc.metadata["page"])
+        return None
+
+    def expand(self, documents: List[Document]) -> List[Document]:
+        """
+        Replaces the chunks by their full page from the parent-document store, keeping each page once at its best rank.
+
+        The summaries, and the chunks whose page is not in the store, are kept as they are.
+        """
+        parents = docstore.get_many([key for key in map(self._parent_id, documents) if key])
+        expanded = []
+        seen = set()
+        for doc in documents:
+            key = self._parent_id(doc)
+            if key not in parents:
+                expanded.append(doc)
+                continue
+            if key in seen:
+                continue
+            seen.add(key)
+            expanded.append(Document(page_content=parents[key]["text"], metadata={**doc.metadata, "parent_id": key}))
+        return expanded
+
+    def build(self, list_documents: List[Dict[str, List[Document]]]) -> List[Document]:
+        """
+        Fuses the documents, expands them to their pages if `expand_parents`, and keeps the best ones
+        that fit in the token budget. The budget counts the formatted text, prefixes and separators included.
+
+        Parameters
+        ----------
+        list_documents : list of dict
+            The result of `ConsultDB.get_all_document`.
+
+        Returns
+        -------
+        List[Document]
+            The documents of the context, best first.
+        """
+        fused = self.fuse(list_documents)
+        if self.expand_parents:
+            fused = self.expand(fused)
+        selected = []
+        used = 0
+        separator = count_tokens(self.SEPARATOR)
+        for doc in fused:
+            tokens = count_tokens(self._entry(len(selected) + 1, doc)) + (separator if selected else 0)
+            if used + tokens > self.token_budget:
+                continue
+            selected.append(doc)
+            used += tokens
+
+        total = sum(len(docs) for results in list_documents for docs in results.values())
+        logger.info(f"Context assembled: {len(selected)} of {total} retrieved chunks, {used} tokens")
+        return selected
+
+    def format(self, documents: List[Document]) -> str:
+        """
+        Joins the documents into the text placed in the prompt.
+        """
+        return self.SEPARATOR.join(self._entry(index, doc) for index, doc in enumerate(documents, start=1))
@@ -1,13 +1,22 @@
-#from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import Qdrant
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
-from qdrant_client.http.exceptions import UnexpectedResponse
-import google.generativeai as genai
+from qdrant_client.models import Distance, VectorParams, PointStruct, PointIdsList
+from qdrant_client.models import (HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+                                  BinaryQuantization, BinaryQuantizationConfig, PayloadSchemaType,
+                                  SearchParams, QuantizationSearchParams, VectorParamsDiff, Disabled,
+                                  ProductQuantization)
+from qdrant_pool import get_qdrant_client, get_async_qdrant_client
+from ingest_manifest import point_id
+from dimension_registry import dimension_registry
+from embeddings import get_embedding_provider
+from rate_limiter import is_rate_limit_error
+from metrics import metrics
 from langchain.schema import Document
-import uuid
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import queue
+import random
+import copy
 import logging
+import time
 import os
 
 """
@@ -18,6 +27,42 @@ Crea un logger para la clase, permitiendo registrar mensajes específicos de est
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+#Esquemas ya inicializados en este proceso | Schemas already bootstrapped in this process
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+"""
+Perfiles de almacenamiento por colección | Per-collection storage profiles.
+hnsw: parámetros m y ef_construct del índice HNSW.
+quantization: None, "scalar" (int8) o "binary"; los vectores cuantizados se mantienen en RAM y la búsqueda
+reordena los candidatos con los vectores originales (rescore).
+on_disk: guarda los vectores originales en disco en lugar de RAM.
+payload_indexes: campos del payload indexados, con su tipo ("keyword" o "integer").
+"""
+STORAGE_PROFILES = {
+    'Documents': {
+        "hnsw": {"m": 16, "ef_construct": 100},
+        "quantization": "scalar",
+        "on_disk": True,
+        "payload_indexes": {"metadata.source": "keyword", "metadata.page": "integer"},
+    },
+    'Summary': {
+        "hnsw": {"m": 16, "ef_construct": 100},
+        "quantization": None,
+        "on_disk": False,
+        "payload_indexes": {"metadata.source": "keyword"},
+    },
+    'Splited_text': {
+        "hnsw": {"m": 16, "ef_construct": 128},
+        "quantization": "scalar",
+        "on_disk": True,
+        "payload_indexes": {"metadata.source": "keyword", "metadata.page": "integer"},
+    },
+}
+
+#Parámetros de búsqueda | Search parameters
+SEARCH_PARAMS = {"hnsw_ef": 128, "top_k": 10, "rescore": True, "oversampling": 2.0}
+
 
 class VectorDB:
     """
@@ -33,26 +78,66 @@ class VectorDB:
         Host del servidor de Qdrant.
     port : int
         Puerto del servidor de Qdrant.
+    grpc_port : int
+        Puerto gRPC del servidor de Qdrant.
+    prefer_grpc : bool
+        Usa el transporte gRPC en lugar de REST (variable de entorno QDRANT_PREFER_GRPC).
+    location : str
+        ":memory:" o una carpeta para usar Qdrant en modo local dentro del proceso (variable de entorno QDRANT_LOCATION).
     collection_name : list
         Lista de nombres de las diferentes colecciones.
     type_collection : str
         Nombre específico de la colección.
+    source : str
+        Nombre del documento de origen de los fragmentos.
+    storage_profiles : dict
+        Perfil de almacenamiento de cada colección (HNSW, cuantización, vectores en disco e índices de payload).
+    search_params : dict
+        Parámetros de búsqueda: `hnsw_ef`, `top_k`, `rescore` y `oversampling`.
+    embedding_provider : EmbeddingProvider
+        Proveedor de embeddings compartido (Gemini o local), elegido con EMBEDDING_PROVIDER.
     model : str
         Modelo de embeddings a utilizar para generar los embeddings.
+    embed_batch_size : int
+        Número de fragmentos por petición de embeddings.
+    upsert_batch_size : int
+        Número de puntos por petición de upsert a Qdrant.
+    upload_workers : int
+        Número de lotes que se suben a Qdrant al mismo tiempo.
+    max_retries : int
+        Reintentos de cada lote de embeddings o de upsert.
+    retry_backoff : float
+        Espera base en segundos entre reintentos (crece exponencialmente).
 
     Methods
     -------
     check_connection_qdrant()
-        Verifica si hay conexión con el servidor de Qdrant.
+        Obtiene el cliente compartido de Qdrant del registro del proceso.
+    check_connection_qdrant_async()
+        Obtiene el cliente asíncrono compartido de Qdrant, ligado al event loop de fondo del proceso.
+    embedding_dimension()
+        Obtiene la dimensión de los embeddings del modelo desde el registro local.
+    get_search_params()
+        Construye los parámetros de búsqueda (ef de HNSW y rescoring de los vectores cuantizados).
     create_vectordb()
-        Crea las colecciones en la base de datos de vectores.
+        Crea las colecciones que faltan en la base de datos de vectores.
+    bootstrap()
+        Crea una sola vez por proceso las colecciones que faltan.
     check_colecction()
         Verifica si la colección especificada existe en la base de datos.
     create_and_store_embedding()
         Crea y almacena los embeddings en la base de datos de vectores.
+    make_document(page_content, page, parent_id)
+        Crea el documento de un fragmento con su ID derivado del contenido.
+    streaming_writer(existing_ids, max_pending_batches)
+        Crea un escritor que embebe y sube los documentos a medida que llegan, con una cola acotada.
+    bulk_upsert(documents)
+        Embebe los documentos por lotes y los sube a Qdrant por lotes.
+    delete_points(ids)
+        Elimina puntos de la colección por su ID.
     """
 
-    def __init__(self, text, type_collection=None):
+    def __init__(self, text, type_collection=None, source=None):
         """
         Construye todos los atributos necesarios para el objeto VectorDB.
 
@@ -62,19 +147,36 @@ class VectorDB:
             Texto a procesar.
         type_collection : str, optional
             Nombre específico de la colección (default es None).
+        source : str, optional
+            Nombre del documento de origen, usado en los IDs y la metadata de los puntos (default es None).
         """
         
         self.text = text
+        self.source = source
         self.url = "http://localhost:6333"
         self.port = 6333
+        self.grpc_port = 6334
+        self.prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+        self.location = os.getenv("QDRANT_LOCATION")
         self.collection_name = ['Documents', 'Summary', 'Splited_text']
         self.type_collection=type_collection
         self.host = "localhost"
-        self.model = "models/embedding-001"
+        self.storage_profiles = copy.deepcopy(STORAGE_PROFILES)
+        self.search_params = dict(SEARCH_PARAMS)
+        self.embedding_provider = get_embedding_provider()
+        self.model = self.embedding_provider.name
+        self.embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", 64))
+        self.upsert_batch_size = int(os.getenv("UPSERT_BATCH_SIZE", 128))
+        self.upload_workers = int(os.getenv("UPLOAD_WORKERS", 2))
+        self.max_retries = 3
+        self.retry_backoff = 1.0
 
     def check_connection_qdrant(self):
         """
-        Verifica si hay conexión con el servidor de Qdrant.
+        Obtiene el cliente compartido de Qdrant del registro del proceso.
+
+        El cliente se crea una sola vez por servidor, mantiene sus conexiones abiertas (keep-alive)
+        y se reconecta automáticamente si falla la verificación de salud.
 
         Returns
         -------
@@ -87,41 +189,248 @@ class VectorDB:
             Si hay un error al conectar con el servidor de Qdrant.
         """
 
-        #Check if there connection with Qdrant
+        #Check if there connection with Qdrant, reusing the shared client
         try:
-            client = QdrantClient(host=self.host, port=self.port, timeout=30.0)
-            logger.info("succesful connection with Qdrant")
-            return client
-        except Exception as e:            
-            raise logger.error(f"connect error with  Qdrant: {e}")
+            return get_qdrant_client(
+                host=self.host,
+                port=self.port,
+                grpc_port=self.grpc_port,
+                prefer_grpc=self.prefer_grpc,
+                timeout=30.0,
+                location=self.location,
+            )
+        except Exception as e:
+            logger.error(f"connect error with  Qdrant: {e}")
+            raise
+
+    def check_connection_qdrant_async(self):
+        """
+        Obtiene el cliente asíncrono compartido de Qdrant, ligado al event loop de fondo del proceso.
+
+        Debe llamarse desde una corrutina (con un event loop en ejecución).
+
+        Returns
+        -------
+        AsyncQdrantClient
+            Cliente asíncrono de Qdrant.
+        """
+
+        try:
+            return get_async_qdrant_client(
+                host=self.host,
+                port=self.port,
+                grpc_port=self.grpc_port,
+                prefer_grpc=self.prefer_grpc,
+                timeout=30.0,
+            )
+        except Exception as e:
+            logger.error(f"connect error with  Qdrant: {e}")
+            raise
+
+    def embedding_dimension(self):
+        """
+        Obtiene la dimensión de los embeddings del modelo desde el registro local.
+
+        Solo la primera vez por modelo se hace un embedding de prueba para conocerla.
+
+        Returns
+        -------
+        int
+            Dimensión de los vectores del modelo.
+        """
+
+        # Realizar un embedding de prueba para obtener la dimensionalidad, solo si no esta registrada
+        return dimension_registry.get_or_probe(self.model, self.embedding_provider.dimension)
+
+    def _quantization_config(self, quantization):
+        """
+        Construye la configuración de cuantización de un perfil de almacenamiento.
+        """
+        if quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+        if quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def _create_payload_indexes(self, client, collection, profile):
+        """
+        Crea los índices de payload del perfil de una colección; los que ya existen no cambian.
+        """
+        for field, schema in profile.get("payload_indexes", {}).items():
+            client.create_payload_index(
+                collection_name=collection,
+                field_name=field,
+                field_schema=PayloadSchemaType.INTEGER if schema == "integer" else PayloadSchemaType.KEYWORD,
+            )
+
+    @staticmethod
+    def _quantization_name(config):
+        #Nombre del perfil de una configuración de cuantización de Qdrant | Profile name of a Qdrant quantization config
+        if isinstance(config, ScalarQuantization):
+            return "scalar"
+        if isinstance(config, BinaryQuantization):
+            return "binary"
+        if isinstance(config, ProductQuantization):
+            return "product"
+        return None
+
+    def _profile_changes(self, info, profile):
+        """
+        Compara la configuración de una colección existente con su perfil.
+
+        Returns
+        -------
+        dict
+            Los valores del perfil que difieren de la colección: `hnsw`, `quantization` y `on_disk`.
+        """
+        changes = {}
+        #El modo local no tiene índice HNSW ni cuantización, solo se comparan en un servidor
+        if not self.location:
+            hnsw = {key: value for key, value in profile.get("hnsw", {}).items()
+                    if getattr(info.config.hnsw_config, key, None) != value}
+            if hnsw:
+                changes["hnsw"] = hnsw
+            if self._quantization_name(info.config.quantization_config) != profile.get("quantization"):
+                changes["quantization"] = profile.get("quantization")
+        if bool(info.config.params.vectors.on_disk) != profile.get("on_disk", False):
+            changes["on_disk"] = profile.get("on_disk", False)
+        return changes
+
+    def apply_storage_profiles(self, collections=None):
+        """
+        Aplica el perfil de almacenamiento completo (HNSW, cuantización, on_disk e índices de payload) a las
+        colecciones que ya existen, y registra en el log lo que cambia.
+
+        No se llama al arrancar: cambiar HNSW, la cuantización u on_disk hace que Qdrant reconstruya el índice
+        o mueva los vectores de la colección. Se llama explícitamente, o con QDRANT_APPLY_STORAGE_PROFILES=true
+        en `create_vectordb`.
+
+        Parameters
+        ----------
+        collections : list of str, optional
+            Colecciones a actualizar (default son todas las de `collection_name`).
+
+        Returns
+        -------
+        dict
+            Los cambios aplicados a cada colección existente, vacíos si ya seguía su perfil.
+        """
+        client = self.check_connection_qdrant()
+        existing = {collection.name for collection in client.get_collections().collections}
+        applied = {}
+        for collection in self.collection_name if collections is None else collections:
+            if collection not in existing:
+                continue
+            profile = self.storage_profiles.get(collection, {})
+            changes = self._profile_changes(client.get_collection(collection_name=collection), profile)
+            if changes:
+                quantization = self._quantization_config(profile.get("quantization")) or Disabled.DISABLED
+                client.update_collection(
+                    collection_name=collection,
+                    vectors_config={"": VectorParamsDiff(on_disk=changes["on_disk"])} if "on_disk" in changes else None,
+                    hnsw_config=HnswConfigDiff(**profile.get("hnsw", {})) if "hnsw" in changes else None,
+                    quantization_config=quantization if "quantization" in changes else None,
+                )
+                logger.info(f"Storage profile of {collection} applied, changed: {changes}")
+            else:
+                logger.info(f"Storage profile of {collection} already applied")
+            self._create_payload_indexes(client, collection, profile)
+            applied[collection] = changes
+        return applied
+
+    def get_search_params(self):
+        """
+        Construye los parámetros de búsqueda (ef de HNSW y rescoring de los vectores cuantizados).
+
+        Returns
+        -------
+        SearchParams
+            Parámetros para `client.search`.
+        """
+        return SearchParams(
+            hnsw_ef=self.search_params["hnsw_ef"],
+            quantization=QuantizationSearchParams(
+                rescore=self.search_params["rescore"],
+                oversampling=self.search_params["oversampling"],
+            ),
+        )
 
     def create_vectordb(self):
+        """
+        Crea las colecciones que faltan en la base de datos de vectores.
+
+        Las colecciones que ya existen no se recrean, así que nunca se pierden datos.
+        Cada colección nueva usa su perfil de `storage_profiles`; a las existentes solo se les aplica con
+        QDRANT_APPLY_STORAGE_PROFILES=true (ver `apply_storage_profiles`).
+
+        Raises
+        ------
+        ValueError
+            Si una colección existente tiene otra dimensión que el proveedor de embeddings elegido, por ejemplo
+            al cambiar EMBEDDING_PROVIDER de gemini (768) a local (384); cada upsert y búsqueda fallaría.
+        Exception
+            Si hay un error al crear las colecciones.
+        """
+
         #verificar el cliente de Qdrant
         client=self.check_connection_qdrant()
         
-        #crear la coleccion
+        #crear las colecciones que no existen
         try:
+            existing = {collection.name for collection in client.get_collections().collections}
+            embedding_dim = self.embedding_dimension()
+
             for collection in self.collection_name:
-                embedding=GoogleGenerativeAIEmbeddings(model=self.model)
-                # Realizar un embedding de prueba para obtener la dimensionalidad
-                test_embedding = embedding.embed_query("test")
-                #obtener la dimensionadlidad de los embeddings
-                embedding_dim = len(test_embedding)
+                profile = self.storage_profiles.get(collection, {})
+
+                if collection in existing:
+                    size = client.get_collection(collection_name=collection).config.params.vectors.size
+                    if size != embedding_dim:
+                        raise ValueError(
+                            f"Collection {collection} has dimension {size}, but the embedding model {self.model} "
+                            f"uses {embedding_dim}. Use the EMBEDDING_PROVIDER the collections were built with, "
+                            f"or delete them and ingest the documents again."
+                        )
+                    continue
 
-                client.recreate_collection(
+                client.create_collection(
                     collection_name=collection,
-                    vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE)
+                    vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE, on_disk=profile.get("on_disk", False)),
+                    hnsw_config=HnswConfigDiff(**profile.get("hnsw", {})),
+                    quantization_config=self._quantization_config(profile.get("quantization")),
                 )
+                self._create_payload_indexes(client, collection, profile)
                 logger.info(f"Create colecction: {collection}, succesfully")
+
+            #Cambiar el perfil de una colección existente la reconstruye, solo se hace si se pide
+            if os.getenv("QDRANT_APPLY_STORAGE_PROFILES", "false").lower() == "true":
+                self.apply_storage_profiles([collection for collection in self.collection_name if collection in existing])
         except Exception as e:
             logger.error(f"Error creating collections: {e}")
+            raise
+
+    def bootstrap(self):
+        """
+        Crea una sola vez por proceso las colecciones que faltan.
+
+        Después del primer llamado, las siguientes verificaciones de colecciones no hacen
+        ninguna petición a Qdrant ni a Gemini.
+        """
+
+        key = (self.host, self.port, self.location, self.model, tuple(self.collection_name))
+        with _bootstrap_lock:
+            if key in _bootstrapped:
+                return
+            self.create_vectordb()
+            _bootstrapped.add(key)
 
     def check_colecction(self):
 
         """
         Verifica si la colección especificada existe en la base de datos.
 
-        Si la colección no existe, la crea utilizando el método `create_vectordb`.
+        Si el esquema ya se inicializó en este proceso no hace nada; si no, crea las
+        colecciones que faltan utilizando el método `bootstrap`.
 
         Raises
         ------
@@ -129,40 +438,33 @@ class VectorDB:
             Si hay un error al verificar la colección.
         """
 
-        
-        #Configure client Qdrant. Connection point with Qdrant server
-        client = self.check_connection_qdrant()
-
-        #Check if the collection exists
         try:
-            client.get_collection(collection_name=self.type_collection)
-            logger.info(f"Collection {self.type_collection} exists")
-
-        except UnexpectedResponse as e:
-            
-            if e.status_code == 404:
-                logger.error(f"Collection {self.type_collection} does not exist")
-                
-                #create collection(s) using  create_vectordb funtion
-                self.create_vectordb()
-            
-            #If is other error type, print the error
-            else:
-                logger.error(f"Error checking collection: {e}")
-                raise
-
+            self.bootstrap()
         except Exception as e:
             logger.error(f"Error checking collection: {e}")
             raise
             
     
-    def create_and_store_embedding(self):
+    def create_and_store_embedding(self, existing_ids=None):
 
         """
         Crea y almacena los embeddings en la base de datos de vectores.
 
         Este método primero verifica si la colección especificada existe,
         luego crea los embeddings y los almacena en la base de datos de vectores.
+        Los IDs de los puntos se derivan del hash del contenido, así que los fragmentos
+        que ya están en `existing_ids` no se vuelven a embeber ni a subir.
+
+        Parameters
+        ----------
+        existing_ids : set of str, optional
+            IDs de los puntos ya almacenados para este documento (default es None).
+
+        Returns
+        -------
+        dict
+            Estadísticas de la carga: `chunks`, `skipped`, `seconds`, `chunks_per_sec`
+            e `ids`, el conjunto de IDs de todos los fragmentos del documento.
 
         Raises
         ------
@@ -176,36 +478,301 @@ class VectorDB:
             #First check if the collection exists
             self.check_colecction()
 
-            #Create embedding
-            embedding=GoogleGenerativeAIEmbeddings(model=self.model)
-            #create metadata with ID unique        
+            #create metadata with an ID derived from the content hash
             # Asegúrate de que self.text sea una cadena
             if isinstance(self.text, str):
-                documents = [Document(page_content=self.text, metadata={"id": str(uuid.uuid4())})]
+                documents = [Document(page_content=self.text, metadata={"id": point_id(self.source or "", self.text), "source": self.source})]
             elif isinstance(self.text, list):
-                documents = [Document(page_content=chunk.page_content, metadata={"id": str(uuid.uuid4())}, page=chunk.metadata['page']) for chunk in self.text] #if isinstance(chunk, str)]
+                documents = [self.make_document(chunk.page_content, chunk.metadata.get('page'), chunk.metadata.get('parent_id')) for chunk in self.text] #if isinstance(chunk, str)]
 
 
             else:
                 raise ValueError(f"Elemento de lista no soportado: {type(self.text)}")
-            
-              # Configure client Qdrant. Connection point with Qdrant server
-            self.check_connection_qdrant()
-            
 
-            #insert data in qdrant
-            # Insert data in qdrant
-            Qdrant.from_documents(
-                documents=documents,
-                embedding=embedding,  # Add this line
-                collection_name=self.type_collection,
-                url=self.url,
-                prefer_grpc=False
-            )
-            logger.info(f"{self.type_collection} saved with sucessfully")            
+            #Repeated chunks share the same ID, keep one of each
+            documents = list({doc.metadata["id"]: doc for doc in documents}.values())
+            ids = {doc.metadata["id"] for doc in documents}
+
+            #Only embed the chunks that are not stored yet
+            existing_ids = existing_ids or set()
+            new_documents = [doc for doc in documents if doc.metadata["id"] not in existing_ids]
+            
+            # Insert data in qdrant in batches using the shared client
+            if new_documents:
+                stats = self.bulk_upsert(new_documents)
+            else:
+                stats = {"chunks": 0, "seconds": 0.0, "chunks_per_sec": 0.0}
+            stats["skipped"] = len(documents) - len(new_documents)
+            stats["ids"] = ids
+            logger.info(f"{self.type_collection} saved with sucessfully ({stats['skipped']} unchanged chunks skipped)")            
+            return stats
 
         except Exception as e:
             logger.error(f"Error creating vector_db: {e}")
             raise
 
 
+
+    def make_document(self, page_content, page=None, parent_id=None):
+        """
+        Crea el documento de un fragmento con su ID derivado del hash del contenido.
+
+        Parameters
+        ----------
+        page_content : str
+            Contenido del fragmento.
+        page : int, optional
+            Página del documento de origen.
+        parent_id : str, optional
+            ID de la página completa en el almacén de documentos padre.
+
+        Returns
+        -------
+        Document
+            El documento con `id`, `source`, `page` y, si lo hay, `parent_id` en su metadata.
+        """
+        metadata = {"id": point_id(self.source or "", page_content), "source": self.source, "page": page}
+        if parent_id is not None:
+            metadata["parent_id"] = parent_id
+        return Document(page_content=page_content, metadata=metadata)
+
+    def streaming_writer(self, existing_ids=None, max_pending_batches=4):
+        """
+        Crea un escritor que embebe y sube los documentos de la colección a medida que llegan.
+
+        Parameters
+        ----------
+        existing_ids : set of str, optional
+            IDs de los puntos ya almacenados para este documento, que no se vuelven a embeber.
+        max_pending_batches : int, optional
+            Lotes que pueden esperar en la cola; cuando está llena, `add` espera (default es 4).
+
+        Returns
+        -------
+        StreamingWriter
+            El escritor, que se debe cerrar con `close()`.
+        """
+        self.check_colecction()
+        return StreamingWriter(self, existing_ids=existing_ids, max_pending_batches=max_pending_batches)
+
+    def _with_retry(self, operation, description, rate_limited=False):
+        """
+        Ejecuta una operación reintentándola con backoff exponencial y jitter.
+
+        Parameters
+        ----------
+        operation : callable
+            Operación sin argumentos a ejecutar.
+        description : str
+            Descripción de la operación para el log.
+        rate_limited : bool, optional
+            Si la operación ya pasa por el limitador compartido, que reintenta los 429 por su cuenta; entonces
+            esos errores no se vuelven a reintentar aquí (default es False).
+
+        Returns
+        -------
+        object
+            El resultado de la operación.
+
+        Raises
+        ------
+        Exception
+            El último error si se agotan los reintentos.
+        """
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return operation()
+            except Exception as e:
+                #The limiter already retried the 429s with its own backoff, do not stack another one on top
+                if rate_limited and is_rate_limit_error(e):
+                    logger.error(f"{description} failed, still rate limited after the limiter retries: {e}")
+                    raise
+                if attempt == self.max_retries:
+                    logger.error(f"{description} failed after {attempt + 1} attempts: {e}")
+                    raise
+                delay = self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"{description} failed ({e}), retrying in {delay:.1f}s")
+                metrics.increment("ingest_retries_total", collection=self.type_collection)
+                time.sleep(delay)
+
+    def bulk_upsert(self, documents):
+        """
+        Embebe los documentos por lotes y los sube a Qdrant por lotes con vectores precalculados.
+
+        El embedding del siguiente lote se calcula mientras se sube el anterior, y cada lote
+        se reintenta con backoff si falla. Los puntos usan el mismo formato de payload que
+        langchain (`page_content` y `metadata`).
+
+        Parameters
+        ----------
+        documents : list of Document
+            Documentos a almacenar, cada uno con un `id` en su metadata.
+
+        Returns
+        -------
+        dict
+            Estadísticas de la carga: `chunks`, `seconds` y `chunks_per_sec`.
+        """
+
+        client = self.check_connection_qdrant()
+        start = time.perf_counter()
+        uploads = []
+
+        def upload(points):
+            #Split the embedded batch in upsert batches
+            for i in range(0, len(points), self.upsert_batch_size):
+                batch = points[i:i + self.upsert_batch_size]
+                with metrics.timer("ingest_stage_seconds", stage="upsert_batch", collection=self.type_collection):
+                    self._with_retry(
+                        lambda: client.upsert(collection_name=self.type_collection, points=batch, wait=True),
+                        f"Upsert of {len(batch)} points in {self.type_collection}",
+                    )
+
+        #Pipeline: the uploads run on a background pool while the next batch is embedded
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as uploader:
+            for i in range(0, len(documents), self.embed_batch_size):
+                batch = documents[i:i + self.embed_batch_size]
+                texts = [doc.page_content for doc in batch]
+                with metrics.timer("ingest_stage_seconds", stage="embed_batch", collection=self.type_collection):
+                    vectors = self._with_retry(
+                        lambda: self.embedding_provider.embed_documents(texts),
+                        f"Embedding of {len(texts)} chunks for {self.type_collection}",
+                        rate_limited=getattr(self.embedding_provider, "limiter", None) is not None,
+                    )
+                points = [
+                    PointStruct(
+                        id=doc.metadata["id"],
+                        vector=vector,
+                        payload={"page_content": doc.page_content, "metadata": doc.metadata},
+                    )
+                    for doc, vector in zip(batch, vectors)
+                ]
+                uploads.append(uploader.submit(upload, points))
+
+            for future in uploads:
+                future.result()
+
+        seconds = time.perf_counter() - start
+        stats = {
+            "chunks": len(documents),
+            "seconds": seconds,
+            "chunks_per_sec": len(documents) / seconds if seconds > 0 else 0.0,
+        }
+        metrics.increment("ingest_chunks_total", len(documents), collection=self.type_collection)
+        logger.info(f"{self.type_collection}: {stats['chunks']} chunks in {seconds:.2f}s ({stats['chunks_per_sec']:.1f} chunks/sec)")
+        return stats
+
+    def delete_points(self, ids):
+        """
+        Elimina puntos de la colección por su ID.
+
+        Parameters
+        ----------
+        ids : iterable of str
+            IDs de los puntos a eliminar.
+        """
+
+        ids = list(ids)
+        if not ids:
+            return
+        client = self.check_connection_qdrant()
+        self._with_retry(
+            lambda: client.delete(collection_name=self.type_collection, points_selector=PointIdsList(points=ids), wait=True),
+            f"Delete of {len(ids)} points in {self.type_collection}",
+        )
+        logger.info(f"{self.type_collection}: {len(ids)} stale chunks deleted")
+
+
+class StreamingWriter:
+    """
+    Embebe y sube a una colección los documentos que recibe, por lotes y en un hilo en segundo plano.
+
+    Los lotes pasan por una cola acotada: si el embedding o Qdrant van más lentos que quien produce
+    los documentos, `add` espera, así que la memoria no crece con el tamaño del documento.
+
+    Attributes
+    ----------
+    vector_db : VectorDB
+        Base de datos de la colección de destino.
+    ids : set of str
+        IDs de todos los fragmentos recibidos.
+    chunks : int
+        Número de fragmentos embebidos y subidos.
+    skipped : int
+        Número de fragmentos que ya estaban almacenados.
+    """
+
+    def __init__(self, vector_db, existing_ids=None, max_pending_batches=4):
+        self.vector_db = vector_db
+        self.existing_ids = existing_ids or set()
+        self.ids = set()
+        self.chunks = 0
+        self.skipped = 0
+        self.seconds = 0.0
+        self._batch = []
+        self._error = None
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"streaming-writer-{vector_db.type_collection}")
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                stats = self.vector_db.bulk_upsert(batch)
+                self.chunks += stats["chunks"]
+                self.seconds += stats["seconds"]
+            except Exception as e:
+                self._error = e
+
+    def _flush(self):
+        if self._error is not None:
+            raise self._error
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def add(self, document):
+        """
+        Añade un documento con un `id` en su metadata; los repetidos y los ya almacenados se omiten.
+        """
+        point = document.metadata["id"]
+        if point in self.ids:
+            return
+        self.ids.add(point)
+        if point in self.existing_ids:
+            self.skipped += 1
+            return
+        self._batch.append(document)
+        if len(self._batch) >= self.vector_db.embed_batch_size:
+            self._flush()
+
+    def close(self):
+        """
+        Sube los documentos pendientes y espera a que termine el hilo.
+
+        Returns
+        -------
+        dict
+            Estadísticas de la carga: `chunks`, `skipped`, `seconds` e `ids`.
+
+        Raises
+        ------
+        Exception
+            El primer error de embedding o de upsert.
+        """
+        try:
+            self._flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        logger.info(f"{self.vector_db.type_collection} streamed ({self.skipped} unchanged chunks skipped)")
+        return {"chunks": self.chunks, "skipped": self.skipped, "seconds": self.seconds, "ids": self.ids}
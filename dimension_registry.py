@@ -0,0 +1,89 @@
+import threading
+import logging
+import json
+import os
+
+"""
+Registro de dimensiones de embeddings | Embedding-dimension registry.
+Guarda en disco la dimensión de los vectores de cada modelo de embeddings, para no tener que
+hacer un embedding de prueba cada vez que se crea o verifica una colección.
+"""
+logger = logging.getLogger(__name__)
+
+
+class DimensionRegistry:
+    """
+    A JSON registry of the embedding dimension of each model.
+
+    Attributes
+    ----------
+    path : str
+        Path of the JSON file.
+
+    Methods
+    -------
+    get(model) -> int or None
+        Returns the recorded dimension of a model.
+    get_or_probe(model, probe) -> int
+        Returns the recorded dimension of a model, or probes it once and records it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dimensions = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the dimension registry {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._dimensions, f)
+        os.replace(temp_path, self.path)
+
+    def get(self, model):
+        """
+        Returns the recorded dimension of a model, or None if it is unknown.
+        """
+        with self._lock:
+            return self._dimensions.get(model)
+
+    def get_or_probe(self, model, probe):
+        """
+        Returns the recorded dimension of a model, or probes it once and records it.
+
+        Parameters
+        ----------
+        model : str
+            The embedding model name.
+        probe : callable
+            Called without arguments to get the dimension when it is not recorded yet.
+
+        Returns
+        -------
+        int
+            The dimension of the vectors of the model.
+        """
+        with self._lock:
+            dimension = self._dimensions.get(model)
+            if dimension is None:
+                dimension = int(probe())
+                self._dimensions[model] = dimension
+                self._save()
+                logger.info(f"Embedding dimension of {model}: {dimension}")
+            return dimension
+
+
+#Registro unico del proceso | Single process-wide registry
+dimension_registry = DimensionRegistry(os.getenv("DIMENSION_REGISTRY_PATH", ".cache/embedding_dimensions.json"))
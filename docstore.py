@@ -0,0 +1,123 @@
+from sqlite_store import open_sqlite
+import threading
+import logging
+import zlib
+import os
+
+"""
+Almacén de documentos padre | Parent-document store.
+Guarda las páginas completas de cada PDF en un archivo SQLite local, comprimidas, en lugar de embeberlas en
+la colección 'Documents'. Solo se embeben los fragmentos de 'Splited_text', cada uno con el ID de su página,
+y al recuperar un fragmento se puede expandir a su página completa.
+"""
+logger = logging.getLogger(__name__)
+
+
+def parent_id(source, page):
+    """
+    Returns the ID of a page of a document.
+    """
+    return f"{source}#{page}"
+
+
+class ParentDocStore:
+    """
+    A SQLite store of the full pages of the documents, keyed by document and page.
+
+    Attributes
+    ----------
+    path : str
+        Path of the SQLite file.
+
+    Methods
+    -------
+    put_pages(source, pages)
+        Stores pages of a document, replacing the ones with the same page number.
+    prune_source(source, keep_pages) -> int
+        Removes the pages of a document that are not in `keep_pages`.
+    get_many(ids) -> dict
+        Returns the pages with the given IDs.
+    stats() -> dict
+        Returns the number of pages and documents.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        #Open the SQLite file only when it is first needed
+        if self._conn is None:
+            self._conn = open_sqlite(
+                self.path,
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "id TEXT PRIMARY KEY, source TEXT NOT NULL, page INTEGER, text BLOB NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS idx_pages_source ON pages (source)",
+            )
+        return self._conn
+
+    def put_pages(self, source, pages):
+        """
+        Stores pages of a document, replacing the ones with the same page number.
+
+        Parameters
+        ----------
+        source : str
+            The name of the document.
+        pages : list of tuple
+            The (page, text) of some pages of the document.
+        """
+        rows = [(parent_id(source, page), source, page, zlib.compress(text.encode("utf-8")))
+                for page, text in pages]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO pages (id, source, page, text) VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+
+    def prune_source(self, source, keep_pages):
+        """
+        Removes the pages of a document that are not in `keep_pages`, for example after it got shorter.
+
+        Returns
+        -------
+        int
+            The number of pages removed.
+        """
+        keep = {parent_id(source, page) for page in keep_pages}
+        with self._lock:
+            conn = self._connection()
+            stored = [row[0] for row in conn.execute("SELECT id FROM pages WHERE source = ?", (source,))]
+            gone = [page for page in stored if page not in keep]
+            conn.executemany("DELETE FROM pages WHERE id = ?", [(page,) for page in gone])
+            conn.commit()
+        return len(gone)
+
+    def get_many(self, ids):
+        """
+        Returns the pages with the given IDs.
+
+        Returns
+        -------
+        dict
+            The `text`, `source` and `page` of each page found, by ID.
+        """
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(f"SELECT id, source, page, text FROM pages WHERE id IN ({','.join('?' * len(ids))})",
+                                ids).fetchall()
+        return {page_id: {"text": zlib.decompress(text).decode("utf-8"), "source": source, "page": page}
+                for page_id, source, page, text in rows}
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            pages, sources = conn.execute("SELECT COUNT(*), COUNT(DISTINCT source) FROM pages").fetchone()
+        return {"pages": pages, "sources": sources}
+
+
+#Almacén único del proceso | Single process-wide store
+docstore = ParentDocStore(os.getenv("DOCSTORE_PATH", ".cache/docstore.sqlite"))
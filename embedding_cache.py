@@ -0,0 +1,238 @@
+from collections import OrderedDict
+from array import array
+from sqlite_store import open_sqlite
+import threading
+import hashlib
+import logging
+import sqlite3
+import time
+import os
+
+"""
+Caché de embeddings de consultas | Query-embedding cache.
+Los vectores de `task_type="retrieval_query"` son deterministas, así que se guardan por
+(modelo, tipo de tarea, texto normalizado) en una caché LRU en memoria y en una caché en disco (SQLite)
+que sobrevive a los reruns de Streamlit y a los reinicios del proceso.
+"""
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    A two-tier (in-memory LRU + on-disk SQLite) cache of embedding vectors.
+
+    Attributes
+    ----------
+    path : str
+        Path of the SQLite file used as the on-disk tier.
+    max_memory_entries : int
+        Maximum number of vectors kept in the in-memory LRU tier.
+    max_disk_entries : int
+        Maximum number of vectors kept on disk; the least recently used are evicted first.
+    ttl : float
+        Seconds a vector stays valid, None to keep it forever.
+    hits : int
+        Number of lookups served from memory or disk.
+    misses : int
+        Number of lookups that had to be embedded.
+
+    Methods
+    -------
+    get_many(model, task_type, texts) -> list
+        Returns the cached vector of each text, or None if it is not cached.
+    set_many(model, task_type, texts, vectors)
+        Stores the vectors of the texts in both tiers.
+    stats() -> dict
+        Returns the hit/miss counters and the size of each tier.
+    clear()
+        Removes every cached vector.
+    """
+
+    def __init__(self, path, max_memory_entries=1024, max_disk_entries=50000, ttl=None):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text):
+        """
+        Normalizes a text so trivially different questions share the same key.
+        """
+        return " ".join(text.lower().split())
+
+    def make_key(self, model, task_type, text):
+        """
+        Builds the cache key of a text from the model, the task type and the normalized text.
+        """
+        raw = f"{model}|{task_type}|{self.normalize(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _connection(self):
+        #Open the SQLite file only when it is first needed
+        if self._conn is None:
+            self._conn = open_sqlite(
+                self.path,
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS idx_accessed_at ON embeddings (accessed_at)",
+            )
+        return self._conn
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _remember(self, key, vector, created_at):
+        self._memory[key] = (vector, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model, task_type, texts):
+        """
+        Returns the cached vector of each text, or None if it is not cached.
+
+        Parameters
+        ----------
+        model : str
+            The embedding model name.
+        task_type : str
+            The embedding task type, for example "retrieval_query".
+        texts : list of str
+            The texts to look up.
+
+        Returns
+        -------
+        list
+            One vector (list of float) or None per text, in the same order as the texts.
+        """
+        now = time.time()
+        keys = [self.make_key(model, task_type, text) for text in texts]
+        found = [None] * len(keys)
+
+        with self._lock:
+            pending = []
+            for index, key in enumerate(keys):
+                entry = self._memory.get(key)
+                if entry is not None and not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    found[index] = entry[0]
+                    self.memory_hits += 1
+                else:
+                    self._memory.pop(key, None)
+                    pending.append(index)
+
+            if pending:
+                try:
+                    conn = self._connection()
+                    for index in pending:
+                        row = conn.execute(
+                            "SELECT vector, created_at FROM embeddings WHERE key = ?", (keys[index],)
+                        ).fetchone()
+                        if row is None:
+                            continue
+                        if self._expired(row[1], now):
+                            conn.execute("DELETE FROM embeddings WHERE key = ?", (keys[index],))
+                            continue
+                        vector = array("f", row[0]).tolist()
+                        conn.execute("UPDATE embeddings SET accessed_at = ? WHERE key = ?", (now, keys[index]))
+                        self._remember(keys[index], vector, row[1])
+                        found[index] = vector
+                    conn.commit()
+                except sqlite3.Error as e:
+                    #The disk tier is an optimization, never a reason to fail a query
+                    logger.warning(f"Embedding cache read error: {e}")
+
+            hits = sum(vector is not None for vector in found)
+            self.hits += hits
+            self.misses += len(found) - hits
+        return found
+
+    def set_many(self, model, task_type, texts, vectors):
+        """
+        Stores the vectors of the texts in both tiers.
+
+        Parameters
+        ----------
+        model : str
+            The embedding model name.
+        task_type : str
+            The embedding task type, for example "retrieval_query".
+        texts : list of str
+            The embedded texts.
+        vectors : list of list of float
+            The vector of each text.
+        """
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(model, task_type, text)
+                vector = list(vector)
+                self._remember(key, vector, now)
+                rows.append((key, array("f", vector).tobytes(), now, now))
+
+            try:
+                conn = self._connection()
+                conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                #Evict the least recently used vectors when the disk tier is over its limit
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache write error: {e}")
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the size of each tier.
+
+        Returns
+        -------
+        dict
+            The counters `hits`, `memory_hits`, `misses`, `hit_rate`, `memory_entries` and `disk_entries`.
+        """
+        with self._lock:
+            try:
+                disk_entries = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except sqlite3.Error:
+                disk_entries = None
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def clear(self):
+        """
+        Removes every cached vector.
+        """
+        with self._lock:
+            self._memory.clear()
+            try:
+                conn = self._connection()
+                conn.execute("DELETE FROM embeddings")
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache clear error: {e}")
+
+
+#Caché única del proceso | Single process-wide cache
+embedding_cache = EmbeddingCache(
+    path=os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite"),
+    max_memory_entries=int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", 1024)),
+    max_disk_entries=int(os.getenv("EMBEDDING_CACHE_DISK_ENTRIES", 50000)),
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL")) if os.getenv("EMBEDDING_CACHE_TTL") else None,
+)
@@ -0,0 +1,217 @@
+from rate_limiter import BACKGROUND, INTERACTIVE, get_rate_limiter
+from tokens import count_tokens
+from abc import ABC, abstractmethod
+import threading
+import asyncio
+import logging
+import os
+
+"""
+Proveedores de embeddings | Embedding providers.
+VectorDB y ConsultDB obtienen sus embeddings de un proveedor común: Gemini (por red) o un modelo local
+de sentence-transformers que corre en CPU por lotes, sin latencia de red ni límites de cuota.
+El proveedor se elige con la variable de entorno EMBEDDING_PROVIDER ("gemini" o "local").
+"""
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProvider(ABC):
+    """
+    Base class of the embedding providers. A provider must implement `embed_documents` and `embed_queries`.
+
+    Attributes
+    ----------
+    name : str
+        Identifier of the model, used in the embedding cache and the dimension registry.
+
+    Methods
+    -------
+    embed_documents(texts) -> list
+        Embeds texts to be stored.
+    embed_queries(texts) -> list
+        Embeds questions to search with.
+    aembed_queries(texts) -> list
+        Asynchronously embeds questions to search with.
+    dimension() -> int
+        Returns the dimension of the vectors.
+    """
+
+    name = None
+
+    @abstractmethod
+    def embed_documents(self, texts):
+        ...
+
+    @abstractmethod
+    def embed_queries(self, texts):
+        ...
+
+    async def aembed_queries(self, texts):
+        #By default run the synchronous call on a worker thread
+        return await asyncio.to_thread(self.embed_queries, texts)
+
+    def dimension(self):
+        return len(self.embed_queries(["test"])[0])
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeddings from the Gemini API, with batched requests.
+
+    Attributes
+    ----------
+    model : str
+        The Gemini embedding model.
+    """
+
+    def __init__(self, model="models/embedding-001"):
+        import google.generativeai as genai
+
+        #Cargar el api_key de google gemini
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        self._genai = genai
+        self.model = model
+        self.name = model
+        #Shared with every other caller of this model in the process
+        self.limiter = get_rate_limiter("google", model)
+
+    def _embed(self, texts, task_type, priority):
+        if not texts:
+            return []
+        texts = list(texts)
+
+        def embed():
+            #A list as content makes Gemini use batchEmbedContents, a single round-trip for the whole batch
+            return self._genai.embed_content(model=self.model, content=texts, task_type=task_type)["embedding"]
+
+        if self.limiter is None:
+            return embed()
+        return self.limiter.call(embed, tokens=sum(count_tokens(text) for text in texts), priority=priority)
+
+    def embed_documents(self, texts):
+        #Documents are only embedded by the ingestion, which gives way to the questions
+        return self._embed(texts, "retrieval_document", BACKGROUND)
+
+    def embed_queries(self, texts):
+        return self._embed(texts, "retrieval_query", INTERACTIVE)  #this is it can recover this information
+
+    async def aembed_queries(self, texts):
+        #Not embed_content_async: google.generativeai keeps one grpc.aio client bound to the first event loop
+        #that used it, and every call from another loop fails with "Event loop is closed"
+        return await asyncio.to_thread(self.embed_queries, texts)
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """
+    Local embeddings with sentence-transformers, with batched multi-threaded CPU inference.
+
+    Attributes
+    ----------
+    model_name : str
+        The sentence-transformers model.
+    batch_size : int
+        Number of texts encoded per forward pass.
+    threads : int
+        Number of CPU threads used by torch, None to keep the default.
+    backend : str
+        "torch", or "onnx" to run an exported (optionally quantized) ONNX model.
+    onnx_file : str
+        ONNX file of the model to load, for example "onnx/model_qint8_avx512_vnni.onnx" for a quantized model.
+    """
+
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", batch_size=64,
+                 threads=None, backend="torch", onnx_file=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.name = f"{model_name}:{backend}" + (f":{onnx_file}" if onnx_file else "")
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        #Load the model only once, on first use
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+
+                if self.threads:
+                    import torch
+                    torch.set_num_threads(self.threads)
+
+                kwargs = {"device": "cpu"}
+                if self.backend != "torch":
+                    kwargs["backend"] = self.backend
+                    if self.onnx_file:
+                        kwargs["model_kwargs"] = {"file_name": self.onnx_file}
+                self._model = SentenceTransformer(self.model_name, **kwargs)
+                logger.info(f"Loaded local embedding model {self.name}")
+            return self._model
+
+    def _encode(self, texts):
+        if not texts:
+            return []
+        model = self._load()
+        return model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        ).tolist()
+
+    def embed_documents(self, texts):
+        return self._encode(texts)
+
+    def embed_queries(self, texts):
+        return self._encode(texts)
+
+    def dimension(self):
+        return self._load().get_sentence_embedding_dimension()
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def register_embedding_provider(provider, instance):
+    """
+    Registers an embedding provider instance under a name, for example a deterministic fake in benchmarks.
+    """
+    with _providers_lock:
+        _providers[provider.lower()] = instance
+
+
+def get_embedding_provider(provider=None):
+    """
+    Returns the process-wide embedding provider configured through the environment.
+
+    Parameters
+    ----------
+    provider : str, optional
+        "gemini" or "local", by default the EMBEDDING_PROVIDER environment variable (default "gemini").
+
+    Returns
+    -------
+    EmbeddingProvider
+        The shared provider instance.
+    """
+    provider = (provider or os.getenv("EMBEDDING_PROVIDER", "gemini")).lower()
+    with _providers_lock:
+        if provider not in _providers:
+            if provider == "gemini":
+                _providers[provider] = GeminiEmbeddingProvider(
+                    model=os.getenv("GEMINI_EMBEDDING_MODEL", "models/embedding-001"))
+            elif provider == "local":
+                threads = os.getenv("LOCAL_EMBEDDING_THREADS")
+                _providers[provider] = SentenceTransformerProvider(
+                    model_name=os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+                    batch_size=int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", 64)),
+                    threads=int(threads) if threads else None,
+                    backend=os.getenv("LOCAL_EMBEDDING_BACKEND", "torch"),
+                    onnx_file=os.getenv("LOCAL_EMBEDDING_ONNX_FILE"),
+                )
+            else:
+                raise ValueError(f"Unknown embedding provider: {provider}")
+        return _providers[provider]
@@ -1,14 +1,66 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains.combine_documents.stuff import StuffDocumentsChain
-from langchain.document_loaders import PyPDFLoader
-from langchain_openai import ChatOpenAI
 from langchain.chains.summarize import load_summarize_chain
 from langchain.docstore.document import Document
 from llm import LLM
+from rate_limiter import BACKGROUND
 from db import VectorDB
-import tempfile
+from answer_cache import answer_cache
+from ingest_manifest import ingest_manifest, content_hash, point_id
+from lexical_index import lexical_index
+from docstore import docstore, parent_id
+from tokens import count_tokens
+from metrics import metrics
+from pdf_parsing import parse_pdf
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
+import logging
+import time
 import os
 
+logger = logging.getLogger(__name__)
+
+
+def iter_pdf_pages(stream, source):
+    """
+    Parses a PDF page by page straight from a binary file, without a temporary file.
+
+    Only the current page is extracted at a time, so the memory does not grow with the number of pages.
+
+    Parameters
+    ----------
+    stream : file-like
+        The uploaded PDF, opened in binary mode.
+    source : str
+        The name of the PDF file, placed in the metadata of each page.
+
+    Yields
+    ------
+    Document
+        One document per page, with its `source` and `page` (from 0) in the metadata.
+    """
+    from pypdf import PdfReader
+
+    stream.seek(0)
+    reader = PdfReader(stream)
+    for index in range(len(reader.pages)):
+        text = reader.pages[index].extract_text() or ""
+        #pypdf keeps every object it parses; drop them, the next pages are read again from the stream
+        reader.resolved_objects.clear()
+        yield Document(page_content=text, metadata={"source": source, "page": index})
+
+
+def upload_size(document):
+    """
+    Returns the size in bytes of an uploaded file, without reading it.
+    """
+    size = getattr(document, "size", None)
+    if size is None:
+        position = document.tell()
+        size = document.seek(0, os.SEEK_END)
+        document.seek(position)
+    return size
+
+
 class IngestData(VectorDB, LLM):
     """
     A class used to ingest data from PDF files, summarize the content, split the text into chunks, 
@@ -24,31 +76,109 @@ class IngestData(VectorDB, LLM):
         The size of the chunks to split the text into (default is 10000).
     overlap_size : int
         The size of the overlap between chunks (default is 900).
+    summary_mode : str
+        "map_reduce" to summarize page groups in parallel and reduce them, or "stuff" for a single prompt.
+    summary_group_tokens : int
+        Token budget of each group of pages summarized in one prompt.
+    summary_workers : int
+        Number of page groups summarized at the same time.
+    parse_workers : int
+        Number of processes used to parse the PDFs.
+    max_workers : int
+        Number of documents summarized and stored at the same time.
+    progress_callback : callable, optional
+        Called as `progress_callback(done, total, name, status)` when a document changes state.
+    streaming : str
+        "true" to ingest every PDF page by page, "false" to never do it, or "auto" to stream the PDFs
+        larger than `streaming_min_bytes`.
+    streaming_min_bytes : int
+        Size from which a PDF is streamed in "auto" mode.
+    stream_queue_batches : int
+        Embedding batches of each collection that may wait in the queue while streaming.
+    parent_documents : bool
+        Whether the full pages go to the local parent-document store instead of being embedded in 'Documents'.
 
     Methods
     -------
     summary(pdf_content)
-        Summarizes the content of the PDF files.
+        Summarizes the content of the PDF files, with a parallel map-reduce for large documents.
     splittext(pdf_content)
         Splits the text content of the PDF files into chunks.
     load_data_to_db()
         Loads the data from the PDF files into the database.
     """
 
-    def __init__(self, pdf_paths, text=None):
+    def __init__(self, pdf_paths, text=None, progress_callback=None):
         
         self.pdf_paths = pdf_paths
         self.text = text
         self.chunks_size=500
         self.overlap_size=50
+        self.summary_mode = os.getenv("SUMMARY_MODE", "map_reduce")
+        self.summary_group_tokens = int(os.getenv("SUMMARY_GROUP_TOKENS", 8000))
+        self.summary_workers = int(os.getenv("SUMMARY_WORKERS", 4))
+        self.parse_workers = int(os.getenv("INGEST_PARSE_WORKERS", os.cpu_count() or 1))
+        self.max_workers = int(os.getenv("INGEST_MAX_WORKERS", 4))
+        self.progress_callback = progress_callback
+        self.streaming = os.getenv("INGEST_STREAMING", "auto").lower()
+        self.streaming_min_bytes = int(os.getenv("INGEST_STREAMING_MIN_BYTES", 20 * 2 ** 20))
+        self.stream_queue_batches = int(os.getenv("INGEST_STREAM_QUEUE_BATCHES", 4))
+        self.parent_documents = os.getenv("PARENT_DOCUMENTS", "true").lower() == "true"
         
         super().__init__(text)
+        LLM.__init__(self)
+        #The summaries give way to the questions in the shared rate limiter
+        self.priority = BACKGROUND
+
+    def _summarize_documents(self, llm, documents):
+        """
+        Summarizes a group of documents that fits in one prompt.
+
+        Returns
+        -------
+        str
+            The summary text.
+        """
+
+        #ChatOpenAI(model_name="gpt-4o", max_retries=0)
+        chain= load_summarize_chain(
+                  llm, chain_type="stuff", 
+                  verbose=False
+        )             
+        return chain.invoke(documents)["output_text"]
+
+    def _group_documents(self, documents):
+        """
+        Groups consecutive documents so that each group fits in the summary token budget.
+
+        Returns
+        -------
+        list
+            A list of groups, each one a list of documents.
+        """
+
+        groups, group, used = [], [], 0
+        for doc in documents:
+            tokens = count_tokens(doc.page_content)
+            if group and used + tokens > self.summary_group_tokens:
+                groups.append(group)
+                group, used = [], 0
+            group.append(doc)
+            used += tokens
+        if group:
+            groups.append(group)
+        return groups
 
     def summary(self, pdf_content):
 
         """
         Summarizes the content of the PDF files.
 
+        In "map_reduce" mode the pages are grouped by the token budget `summary_group_tokens`,
+        the groups are summarized in parallel (at most `summary_workers` at once) and the partial
+        summaries are reduced again until a single summary remains. In "stuff" mode every page
+        is sent in a single prompt.
+
         Parameters
         ----------
         pdf_content : list
@@ -56,23 +186,42 @@ class IngestData(VectorDB, LLM):
 
         Returns
         -------
-        list
-            A list of summarized content.
+        str
+            The summary of the content.
         """
         
         documents = [Document(page_content=data.page_content) for data in pdf_content]
                    
         
-        llm=LLM().init_llm()
-        
-        #ChatOpenAI(model_name="gpt-4o", max_retries=0)
-        chain= load_summarize_chain(
-                  llm, chain_type="stuff", 
-                  verbose=False
-        )             
-        
-        summaries = chain.invoke( documents)
-        return summaries
+        llm=self.init_llm()
+
+        if self.summary_mode == "stuff":
+            return self._summarize_documents(llm, documents)
+
+        return self._map_reduce(llm, self._group_documents(documents))
+
+    def _map_reduce(self, llm, groups):
+        """
+        Summarizes the groups in parallel and reduces the summaries until a single summary remains.
+
+        Returns
+        -------
+        str
+            The summary of all the groups.
+        """
+
+        #Map: summarize the page groups in parallel, reduce: summarize the summaries until one is left
+        while len(groups) > 1:
+            with ThreadPoolExecutor(max_workers=self.summary_workers) as summarizers:
+                partial = list(summarizers.map(lambda group: self._summarize_documents(llm, group), groups))
+            logger.info(f"Summarized {len(groups)} groups")
+            reduced = self._group_documents([Document(page_content=text) for text in partial])
+            if len(reduced) >= len(groups):
+                #The summaries do not get shorter, reduce them all in one prompt
+                reduced = [[Document(page_content=text) for text in partial]]
+            groups = reduced
+
+        return self._summarize_documents(llm, groups[0]) if groups else ""
 
     def splittext(self, pdf_content):
 
@@ -96,44 +245,302 @@ class IngestData(VectorDB, LLM):
         chunks = splitter.split_documents(pdf_content)
         return  chunks
     
+    def _report(self, done, total, name, status):
+        """
+        Reports the progress of a document to the progress callback, if there is one.
+        """
+        logger.info(f"[{done}/{total}] {name}: {status}")
+        if self.progress_callback is not None:
+            self.progress_callback(done, total, name, status)
+
+    def _store_document(self, name, file_hash, pdf_read):
+        """
+        Summarizes, splits and stores one parsed PDF, writing the three collections at the same time.
+        The split chunks are also added to the local lexical index. In parent-document mode the full pages
+        go to the local docstore instead of 'Documents', and each chunk points to its page with `parent_id`.
+
+        Only the chunks that are not stored yet are embedded, and the chunks of a previous version
+        of the file that are gone are deleted. The stored point IDs are recorded in the manifest.
+
+        Parameters
+        ----------
+        name : str
+            The name of the PDF file.
+        file_hash : str
+            The hash of the content of the PDF file.
+        pdf_read : list
+            The pages of the PDF.
+
+        Returns
+        -------
+        int
+            The number of chunks embedded and stored in the three collections.
+        """
+
+        previous = ingest_manifest.point_ids(name)
+
+        def store(collection, text):
+            with metrics.timer("ingest_stage_seconds", stage="store", collection=collection):
+                vector_db = VectorDB(text=text, type_collection=collection, source=name)
+                stats = vector_db.create_and_store_embedding(existing_ids=previous.get(collection, set()))
+                #Delete the chunks of the previous version of the file that are gone
+                vector_db.delete_points(previous.get(collection, set()) - stats["ids"])
+            return collection, stats
+
+        def store_summary():
+            #Get the summary and store it
+            with metrics.timer("ingest_stage_seconds", stage="summary"):
+                summary = self.summary(pdf_read)
+            return store("Summary", summary)
+
+        def store_splits():
+            #Split text and store it
+            with metrics.timer("ingest_stage_seconds", stage="split"):
+                split_result = self.splittext(pdf_read)
+            if self.parent_documents:
+                for chunk in split_result:
+                    chunk.metadata["parent_id"] = parent_id(name, chunk.metadata.get("page"))
+            result = store("Splited_text", split_result)
+            #Keep the local lexical index in step with the Splited_text collection
+            with metrics.timer("ingest_stage_seconds", stage="lexical_index"):
+                lexical_index.replace_source(name, [(point_id(name, chunk.page_content), chunk.page_content, chunk.metadata.get("page"))
+                                                    for chunk in split_result])
+            return result
+
+        def store_documents():
+            if not self.parent_documents:
+                #Document full store it
+                return store("Documents", pdf_read)
+            #Parent-document mode: the full pages go to the local docstore, only the chunks are embedded
+            with metrics.timer("ingest_stage_seconds", stage="docstore"):
+                docstore.put_pages(name, [(page.metadata.get("page"), page.page_content) for page in pdf_read])
+                docstore.prune_source(name, [page.metadata.get("page") for page in pdf_read])
+            return "Documents", self._drop_embedded_pages(name, previous)
+
+        with ThreadPoolExecutor(max_workers=3) as writers:
+            futures = [writers.submit(task) for task in (store_summary, store_splits, store_documents)]
+            results = dict(future.result() for future in futures)
+
+        ingest_manifest.update(name, file_hash, {collection: stats["ids"] for collection, stats in results.items()})
+        return sum(stats["chunks"] for stats in results.values())
+
+    def _drop_embedded_pages(self, name, previous):
+        """
+        Deletes the pages of a document embedded in 'Documents' before the parent-document mode was used.
+
+        Returns
+        -------
+        dict
+            The stats of the 'Documents' collection, which has no chunks of the document anymore.
+        """
+        VectorDB(text=None, type_collection="Documents", source=name).delete_points(previous.get("Documents", set()))
+        return {"chunks": 0, "skipped": 0, "ids": set()}
+
+    def _store_document_streaming(self, name, file_hash, upload):
+        """
+        Parses, splits, embeds and stores one PDF page by page, straight from the uploaded buffer.
+
+        The pages are read lazily and flow into the parent-document store (or the 'Documents' writer) and
+        through the splitter into the 'Splited_text' writer, whose bounded queues make the parsing wait when embedding or Qdrant fall behind. The page
+        groups are summarized as they fill up and only their partial summaries are kept, so the memory
+        stays flat whatever the size of the PDF.
+
+        Parameters
+        ----------
+        name : str
+            The name of the PDF file.
+        file_hash : str
+            The hash of the content of the PDF file.
+        upload : file-like
+            The uploaded PDF.
+
+        Returns
+        -------
+        int
+            The number of chunks embedded and stored in the three collections.
+        """
+
+        previous = ingest_manifest.point_ids(name)
+        splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunks_size, chunk_overlap=self.overlap_size)
+        collections = ("Splited_text",) if self.parent_documents else ("Documents", "Splited_text")
+        databases = {collection: VectorDB(text=None, type_collection=collection, source=name)
+                     for collection in collections}
+        writers = {collection: vector_db.streaming_writer(existing_ids=previous.get(collection, set()),
+                                                          max_pending_batches=self.stream_queue_batches)
+                   for collection, vector_db in databases.items()}
+        llm = self.init_llm()
+        group, used, summaries, pages = [], 0, [], 0
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.summary_workers) as summarizers:
+                for page in iter_pdf_pages(upload, name):
+                    pages += 1
+                    if self.parent_documents:
+                        docstore.put_pages(name, [(page.metadata["page"], page.page_content)])
+                        parent = parent_id(name, page.metadata["page"])
+                    else:
+                        writers["Documents"].add(databases["Documents"].make_document(page.page_content, page.metadata["page"]))
+                        parent = None
+
+                    #Split only this page, the chunks overlap within a page
+                    with metrics.timer("ingest_stage_seconds", stage="split"):
+                        chunks = splitter.split_documents([page])
+                    for chunk in chunks:
+                        writers["Splited_text"].add(databases["Splited_text"].make_document(chunk.page_content, chunk.metadata.get("page"), parent))
+                    lexical_index.add_chunks(name, [(point_id(name, chunk.page_content), chunk.page_content, chunk.metadata.get("page"))
+                                                    for chunk in chunks])
+
+                    #Summarize each page group as soon as it is full, at most `summary_workers` at once
+                    tokens = count_tokens(page.page_content)
+                    if group and used + tokens > self.summary_group_tokens:
+                        summaries.append(summarizers.submit(self._summarize_documents, llm, group))
+                        group, used = [], 0
+                        if len(summaries) > self.summary_workers:
+                            summaries[-self.summary_workers - 1].result()
+                    group.append(Document(page_content=page.page_content))
+                    used += tokens
+                if group:
+                    summaries.append(summarizers.submit(self._summarize_documents, llm, group))
+                partial = [future.result() for future in summaries]
+        except BaseException:
+            for writer in writers.values():
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            raise
+
+        results = {collection: writer.close() for collection, writer in writers.items()}
+        for collection, stats in results.items():
+            #Delete the chunks of the previous version of the file that are gone
+            databases[collection].delete_points(previous.get(collection, set()) - stats["ids"])
+        lexical_index.prune_source(name, results["Splited_text"]["ids"])
+        if self.parent_documents:
+            docstore.prune_source(name, range(pages))
+            results["Documents"] = self._drop_embedded_pages(name, previous)
+        logger.info(f"{name}: {pages} pages streamed")
+
+        #Reduce the partial summaries and store the summary
+        with metrics.timer("ingest_stage_seconds", stage="summary"):
+            if len(partial) == 1:
+                summary = partial[0]
+            else:
+                summary = self._map_reduce(llm, self._group_documents([Document(page_content=text) for text in partial]))
+        vector_db = VectorDB(text=summary, type_collection="Summary", source=name)
+        results["Summary"] = vector_db.create_and_store_embedding(existing_ids=previous.get("Summary", set()))
+        vector_db.delete_points(previous.get("Summary", set()) - results["Summary"]["ids"])
+
+        ingest_manifest.update(name, file_hash, {collection: stats["ids"] for collection, stats in results.items()})
+        return sum(stats["chunks"] for stats in results.values())
+
+    def _use_streaming(self, document):
+        """
+        Returns whether an uploaded PDF is ingested page by page.
+        """
+        if self.streaming == "true":
+            return True
+        if self.streaming == "false":
+            return False
+        return upload_size(document) >= self.streaming_min_bytes
+
     def load_data_to_db(self):
        
-       """
+        """
         Loads the data from the PDF files into the database.
 
-        This method processes each document, creates a temporary file to store the content,
-        loads the PDF, summarizes the content, splits the text, and stores the data in the database.
+        The PDFs are parsed in parallel on a process pool. As soon as a PDF is parsed, it is summarized,
+        split and stored on a bounded thread pool, and the three collection writes of a document run at
+        the same time. Large PDFs (see `streaming`) are instead streamed page by page with bounded memory. The progress of each document is sent to `progress_callback`.
+        Files already ingested with the same content are skipped, and changed files only embed their
+        new chunks. Once the collections change, the semantic answer cache is invalidated.
+
+        Raises
+        ------
+        RuntimeError
+            If one or more documents could not be ingested. The other documents are still stored.
         """
         
         #Verify if exist pdf_paths
-       if self.pdf_paths is not None:
-
-        # Processes each document
-        for document in self.pdf_paths:
-
-            #creating a temporaly file to stora the content of the load file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                temp_file.write(document.read())  # Escribimos el contenido del archivo subido
-                doc = temp_file.name      
-                
-            try:
-                #Load the pdf
-                pdf_loader = PyPDFLoader(doc)
-                #Read the pdf
-                pdf_read=pdf_loader.load()
-                
-                #Get the summary and store it
-                summary_result = self.summary(pdf_read)
-                VectorDB(text=summary_result["input_documents"][0].page_content, type_collection="Summary").create_and_store_embedding()
-                
-                #Split text and store it
-                split_result = self.splittext(pdf_read)
-                VectorDB(text=split_result, type_collection="Splited_text").create_and_store_embedding()            
-                
-                #Document full store it
-                VectorDB(text=pdf_read, type_collection="Documents").create_and_store_embedding()
+        if self.pdf_paths is None:
+            return
+
+        total = len(self.pdf_paths)
+        done = 0
+        failed = []
+        chunks = 0
+        changed = False
+        start = time.perf_counter()
+
+        #Large files are streamed page by page from their buffer, the others are read in this thread
+        #and parsed on the process pool, the workers only receive bytes
+        pending = []
+        streamed = []
+        for index, document in enumerate(self.pdf_paths):
+            name = getattr(document, "name", f"document_{index}.pdf")
+            if self._use_streaming(document):
+                file_hash, data = content_hash(document), None
+            else:
+                data = document.read()
+                file_hash = content_hash(data)
+
+            #Skip the files that were already ingested with the same content
+            if ingest_manifest.is_unchanged(name, file_hash) and lexical_index.has_source(name):
+                done += 1
+                self._report(done, total, name, "unchanged, skipped")
+            elif data is None:
+                streamed.append((name, file_hash, document))
+            else:
+                pending.append((name, file_hash, data))
+
+        try:
+            #Spawned and not forked: this process already runs threads (Qdrant, gRPC, the event loop) holding locks
+            with ProcessPoolExecutor(max_workers=min(self.parse_workers, max(len(pending), 1)),
+                                     mp_context=multiprocessing.get_context("spawn")) as parsers, \
+                 ThreadPoolExecutor(max_workers=self.max_workers) as storers:
+
+                #1.Parse every PDF on the process pool, and start streaming the large ones
+                submitted = time.perf_counter()
+                parsing = {parsers.submit(parse_pdf, data): (name, file_hash) for name, file_hash, data in pending}
+                storing = {storers.submit(self._store_document_streaming, name, file_hash, document): name
+                           for name, file_hash, document in streamed}
+                changed = bool(streamed)
+                for future in as_completed(parsing):
+                    name, file_hash = parsing[future]
+                    metrics.observe("ingest_stage_seconds", time.perf_counter() - submitted, stage="parse")
+                    try:
+                        pdf_read = future.result()
+                    except Exception as e:
+                        logger.error(f"Error parsing {name}: {e}")
+                        failed.append(name)
+                        done += 1
+                        self._report(done, total, name, "failed")
+                        continue
+                    self._report(done, total, name, f"parsed {len(pdf_read)} pages")
+
+                    #2.Summarize, split and store it as soon as it is parsed
+                    storing[storers.submit(self._store_document, name, file_hash, pdf_read)] = name
+                    changed = True
+
+                for future in as_completed(storing):
+                    name = storing[future]
+                    done += 1
+                    try:
+                        chunks += future.result()
+                        self._report(done, total, name, "stored")
+                    except Exception as e:
+                        logger.error(f"Error storing {name}: {e}")
+                        failed.append(name)
+                        self._report(done, total, name, "failed")
+        finally:
+            #The collections changed, the cached answers may be outdated
+            if changed:
+                answer_cache.invalidate()
 
-            finally:
-            # Asegurarse de eliminar el archivo temporal
-                os.unlink(doc)
+            seconds = time.perf_counter() - start
+            metrics.observe("ingest_stage_seconds", seconds, stage="total")
+            #Ingestions are rare, their metrics are always written
+            metrics.export(force=True)
+            logger.info(f"Ingestion throughput: {chunks} chunks in {seconds:.2f}s ({chunks / seconds if seconds > 0 else 0.0:.1f} chunks/sec)")
 
+        if failed:
+            raise RuntimeError(f"Could not ingest: {', '.join(failed)}")
@@ -0,0 +1,179 @@
+import threading
+import hashlib
+import logging
+import json
+import uuid
+import os
+
+"""
+Manifiesto de ingesta | Ingestion manifest.
+Registra por cada archivo cargado el hash de su contenido y los IDs de los puntos guardados en cada colección.
+Los IDs de los puntos se derivan del hash del contenido de cada fragmento, así que volver a cargar un PDF
+sin cambios no vuelve a generar embeddings ni duplica puntos. Varios procesos pueden compartir el manifiesto:
+se vuelve a leer cuando el archivo cambia y cada escritura solo modifica la entrada de su archivo.
+"""
+logger = logging.getLogger(__name__)
+
+#Espacio de nombres de los IDs de los puntos | Namespace of the point IDs
+POINT_NAMESPACE = uuid.UUID("6f9d3f8e-2c4b-4a55-9a57-1f0e8b7c2d11")
+
+
+def content_hash(data, block_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a text, of raw bytes, or of a binary file read by blocks.
+    A file is hashed from its start and left at its start.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    data.seek(0)
+    for block in iter(lambda: data.read(block_size), b""):
+        digest.update(block)
+    data.seek(0)
+    return digest.hexdigest()
+
+
+def point_id(source, text):
+    """
+    Returns the deterministic point ID of a chunk of a source document.
+
+    Parameters
+    ----------
+    source : str
+        The name of the document the chunk belongs to.
+    text : str
+        The content of the chunk.
+
+    Returns
+    -------
+    str
+        A UUID derived from the source and the hash of the content.
+    """
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{source}|{content_hash(text)}"))
+
+
+class IngestManifest:
+    """
+    A JSON manifest of the ingested files and the point IDs stored for each of them.
+
+    The file is read again whenever another process changed it, and every update is merged into the latest
+    content of the file instead of overwriting it with the entries of this process.
+
+    Attributes
+    ----------
+    path : str
+        Path of the JSON file.
+
+    Methods
+    -------
+    is_unchanged(name, file_hash) -> bool
+        Checks if a file with the same name and content was already ingested.
+    point_ids(name) -> dict
+        Returns the point IDs stored for a file, by collection.
+    update(name, file_hash, collections)
+        Records a file and its point IDs, and saves the manifest.
+    remove(name)
+        Forgets a file, and saves the manifest.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._files = {}
+        self._refresh()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the ingestion manifest {self.path}: {e}")
+            return {}
+
+    def _refresh(self):
+        #Read the file again if it changed since it was last read, for example written by another process
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            self._files = self._load()
+            self._stamp = stamp
+
+    def _save(self):
+        #Write to a temporary file and replace, so a crash never leaves a half written manifest
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._files, f)
+        os.replace(temp_path, self.path)
+        self._stamp = self._file_stamp()
+
+    def is_unchanged(self, name, file_hash):
+        """
+        Checks if a file with the same name and content was already ingested.
+        """
+        with self._lock:
+            self._refresh()
+            entry = self._files.get(name)
+            return entry is not None and entry["file_hash"] == file_hash
+
+    def point_ids(self, name):
+        """
+        Returns the point IDs stored for a file, by collection.
+
+        Returns
+        -------
+        dict
+            Collection names as keys and sets of point IDs as values.
+        """
+        with self._lock:
+            self._refresh()
+            entry = self._files.get(name, {})
+            return {collection: set(ids) for collection, ids in entry.get("collections", {}).items()}
+
+    def update(self, name, file_hash, collections):
+        """
+        Records a file and its point IDs, and saves the manifest.
+
+        Parameters
+        ----------
+        name : str
+            The name of the file.
+        file_hash : str
+            The hash of the content of the file.
+        collections : dict
+            Collection names as keys and the point IDs stored for the file as values.
+        """
+        with self._lock:
+            #Merge into the latest content of the file, so the entries written by other processes are kept
+            self._refresh()
+            self._files[name] = {
+                "file_hash": file_hash,
+                "collections": {collection: sorted(ids) for collection, ids in collections.items()},
+            }
+            self._save()
+
+    def remove(self, name):
+        """
+        Forgets a file, and saves the manifest.
+        """
+        with self._lock:
+            self._refresh()
+            if self._files.pop(name, None) is not None:
+                self._save()
+
+
+#Manifiesto unico del proceso | Single process-wide manifest
+ingest_manifest = IngestManifest(os.getenv("INGEST_MANIFEST_PATH", ".cache/ingest_manifest.json"))
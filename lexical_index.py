@@ -0,0 +1,285 @@
+from collections import Counter
+from sqlite_store import open_sqlite
+import threading
+import heapq
+import logging
+import sqlite3
+import math
+import time
+import re
+import os
+
+"""
+Índice léxico local (BM25) | Local lexical (BM25) index.
+Índice invertido en memoria de los fragmentos de 'Splited_text', guardado en SQLite y actualizado por
+documento durante la ingesta. Responde en menos de un milisegundo sin llamar a la API de embeddings,
+así que sirve para preguntas con nombres, códigos o números de sección y como respaldo cuando los
+embeddings no llegan a tiempo. Si otro proceso (otro worker de la API o Streamlit) cambia el archivo SQLite,
+el índice en memoria se reconstruye en el siguiente uso.
+"""
+logger = logging.getLogger(__name__)
+
+#Palabras, y códigos o números de sección como "4.2.1" o "ISO-9001" | Words, and codes or section numbers
+TOKEN_PATTERN = re.compile(r"\w+(?:[.\-/]\w+)*")
+
+
+def tokenize(text):
+    """
+    Splits a text into lowercase terms. Codes like "4.2.1" are kept whole and also split into their parts.
+    """
+    terms = []
+    for match in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(match)
+        if not match.isalnum():
+            terms.extend(part for part in re.split(r"[.\-/]", match) if part)
+    return terms
+
+
+class LexicalIndex:
+    """
+    An in-memory BM25 inverted index of the chunks, persisted in a SQLite file.
+
+    Only the chunk texts are stored on disk; the postings are rebuilt in memory when the index is first used,
+    and again whenever another process commits changes to the file.
+
+    Attributes
+    ----------
+    path : str
+        Path of the SQLite file.
+    k1 : float
+        BM25 term frequency saturation.
+    b : float
+        BM25 length normalization.
+
+    Methods
+    -------
+    replace_source(source, chunks)
+        Makes the chunks of a source exactly `chunks`, adding the new ones and removing the gone ones.
+    add_chunks(source, chunks) -> int
+        Adds the chunks of a source that are not indexed yet.
+    prune_source(source, keep_ids) -> int
+        Removes the chunks of a source that are not in `keep_ids`.
+    remove_source(source)
+        Removes every chunk of a source.
+    has_source(source) -> bool
+        Returns whether a source is indexed.
+    search(query, limit) -> list
+        Returns the best chunks for a query by BM25 score.
+    stats() -> dict
+        Returns the number of chunks, terms and sources.
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._conn = None
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._data_version = None
+        self._documents = {}     #id -> (source, page, text, length)
+        self._postings = {}      #term -> {id: term frequency}
+        self._sources = {}       #source -> set of ids
+        self._total_length = 0
+        self._norms = None       #id -> BM25 length normalization, rebuilt after every change
+
+    def _connection(self):
+        #Open the SQLite file only when it is first needed
+        if self._conn is None:
+            self._conn = open_sqlite(
+                self.path,
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, source TEXT NOT NULL, page INTEGER, text TEXT NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS idx_source ON chunks (source)",
+            )
+        return self._conn
+
+    def _add(self, chunk_id, source, page, text):
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        self._documents[chunk_id] = (source, page, text, length)
+        self._sources.setdefault(source, set()).add(chunk_id)
+        self._total_length += length
+        self._norms = None
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[chunk_id] = frequency
+
+    def _remove(self, chunk_id):
+        source, _, text, length = self._documents.pop(chunk_id)
+        self._total_length -= length
+        self._norms = None
+        ids = self._sources.get(source)
+        if ids is not None:
+            ids.discard(chunk_id)
+            if not ids:
+                del self._sources[source]
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _load(self):
+        #Build the postings from the stored chunks the first time the index is used, and rebuild them
+        #when another connection (another process) committed changes since they were built
+        try:
+            data_version = self._connection().execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read the lexical index {self.path}: {e}")
+            data_version = self._data_version
+        if self._loaded and data_version == self._data_version:
+            return
+        if self._loaded:
+            logger.info("Lexical index changed in another process, reloading it")
+            self._documents, self._postings, self._sources = {}, {}, {}
+            self._total_length = 0
+            self._norms = None
+        self._data_version = data_version
+        start = time.perf_counter()
+        try:
+            rows = self._connection().execute("SELECT id, source, page, text FROM chunks").fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read the lexical index {self.path}: {e}")
+            rows = []
+        for chunk_id, source, page, text in rows:
+            self._add(chunk_id, source, page, text)
+        self._loaded = True
+        logger.info(f"Lexical index loaded: {len(rows)} chunks in {time.perf_counter() - start:.3f}s")
+
+    def replace_source(self, source, chunks):
+        """
+        Makes the chunks of a source exactly `chunks`, adding the new ones and removing the gone ones.
+
+        Parameters
+        ----------
+        source : str
+            The name of the document.
+        chunks : list of tuple
+            The (id, text, page) of every chunk of the document.
+        """
+        chunks = list(chunks)
+        with self._lock:
+            added = self.add_chunks(source, chunks)
+            removed = self.prune_source(source, {chunk_id for chunk_id, _, _ in chunks})
+        logger.info(f"Lexical index of {source}: {added} chunks added, {removed} removed")
+
+    def add_chunks(self, source, chunks):
+        """
+        Adds the chunks of a source that are not indexed yet, so a document can be indexed page by page.
+
+        Parameters
+        ----------
+        source : str
+            The name of the document.
+        chunks : list of tuple
+            The (id, text, page) of some chunks of the document.
+
+        Returns
+        -------
+        int
+            The number of chunks added.
+        """
+        with self._lock:
+            self._load()
+            current = self._sources.get(source, set())
+            new = {}
+            for chunk_id, text, page in chunks:
+                if chunk_id not in current and chunk_id not in new:
+                    new[chunk_id] = (text, page)
+            for chunk_id, (text, page) in new.items():
+                if chunk_id in self._documents:
+                    self._remove(chunk_id)
+                self._add(chunk_id, source, page, text)
+
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO chunks (id, source, page, text) VALUES (?, ?, ?, ?)",
+                             [(chunk_id, source, page, text) for chunk_id, (text, page) in new.items()])
+            conn.commit()
+            return len(new)
+
+    def prune_source(self, source, keep_ids):
+        """
+        Removes the chunks of a source that are not in `keep_ids`.
+
+        Returns
+        -------
+        int
+            The number of chunks removed.
+        """
+        with self._lock:
+            self._load()
+            gone = self._sources.get(source, set()) - set(keep_ids)
+            for chunk_id in gone:
+                self._remove(chunk_id)
+
+            conn = self._connection()
+            conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in gone])
+            conn.commit()
+            return len(gone)
+
+    def remove_source(self, source):
+        """
+        Removes every chunk of a source.
+        """
+        self.replace_source(source, [])
+
+    def has_source(self, source):
+        """
+        Returns whether a source is indexed.
+        """
+        with self._lock:
+            self._load()
+            return source in self._sources
+
+    def search(self, query, limit=10):
+        """
+        Returns the best chunks for a query by BM25 score.
+
+        Parameters
+        ----------
+        query : str
+            The question.
+        limit : int, optional
+            Maximum number of chunks (default is 10).
+
+        Returns
+        -------
+        list of dict
+            The `id`, `text`, `source`, `page` and `score` of each chunk, best first.
+        """
+        with self._lock:
+            self._load()
+            total = len(self._documents)
+            if not total:
+                return []
+            if self._norms is None:
+                average_length = self._total_length / total
+                self._norms = {chunk_id: self.k1 * (1 - self.b + self.b * document[3] / average_length)
+                               for chunk_id, document in self._documents.items()}
+            norms = self._norms
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = idf * (self.k1 + 1)
+                for chunk_id, frequency in postings.items():
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * frequency / (frequency + norms[chunk_id])
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            results = []
+            for chunk_id, score in best:
+                source, page, text, _ = self._documents[chunk_id]
+                results.append({"id": chunk_id, "text": text, "source": source, "page": page, "score": score})
+            return results
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {"chunks": len(self._documents), "terms": len(self._postings), "sources": len(self._sources)}
+
+
+#Índice único del proceso | Single process-wide index
+lexical_index = LexicalIndex(os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical_index.sqlite"))
@@ -0,0 +1,106 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from rate_limiter import INTERACTIVE, is_rate_limit_error
+from tokens import count_tokens
+from metrics import metrics
+from typing import Any
+import asyncio
+import time
+
+"""
+Modelo de chat con límite de peticiones | Rate-limited chat model.
+Envuelve un cliente de chat de LangChain para que cada llamada pase por el limitador compartido de su
+proveedor y modelo, con la prioridad de quien lo usa (preguntas o ingesta).
+"""
+
+
+def _message_tokens(messages):
+    #Estimated prompt tokens, taken from the token budget before the call
+    total = 0
+    for message in messages:
+        content = message.content
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+        total += count_tokens(content)
+    return total
+
+
+def _output_tokens(result):
+    return sum(count_tokens(generation.text) for generation in result.generations)
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """
+    A chat model that runs the calls of `model` through `limiter`, retrying them with backoff on 429.
+
+    Attributes
+    ----------
+    model : BaseChatModel
+        The client of the provider.
+    limiter : RateLimiter
+        The shared limiter of the provider and model.
+    priority : str
+        "interactive" for the questions, "background" for the ingestion.
+    """
+
+    model: BaseChatModel
+    limiter: Any
+    priority: str = INTERACTIVE
+
+    @property
+    def _llm_type(self):
+        return f"rate-limited-{self.model._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return self.model._identifying_params
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        result = self.limiter.call(lambda: self.model._generate(messages, stop=stop, **kwargs),
+                                   tokens=_message_tokens(messages), priority=self.priority)
+        self.limiter.charge(_output_tokens(result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        result = await self.limiter.acall(lambda: self.model._agenerate(messages, stop=stop, **kwargs),
+                                          tokens=_message_tokens(messages), priority=self.priority)
+        self.limiter.charge(_output_tokens(result))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = _message_tokens(messages)
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens, self.priority)
+            start = time.perf_counter()
+            latency, throttled, generated = None, False, 0
+            try:
+                for chunk in self.model._stream(messages, stop=stop, **kwargs):
+                    if latency is None:
+                        #Time to the first token, the whole stream depends on the length of the answer
+                        latency = time.perf_counter() - start
+                    generated += count_tokens(chunk.text)
+                    yield chunk
+                break
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                #Only a stream rejected before its first token can be retried
+                delay = self.limiter.retry_delay(e, attempt) if latency is None else None
+                if delay is None:
+                    raise
+            finally:
+                self.limiter.release(latency, throttled)
+                self.limiter.charge(generated)
+                if throttled:
+                    metrics.increment("rate_limited_total", limiter=self.limiter.name)
+            time.sleep(delay)
+            attempt += 1
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        #Stream on a worker thread, so the limiter waits do not block the event loop
+        iterator = self._stream(messages, stop=stop, **kwargs)
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, done)
+            if chunk is done:
+                return
+            yield chunk
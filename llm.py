@@ -1,40 +1,53 @@
 import logging
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langfuse.decorators import observe
-from langfuse.openai import openai
+from model_registry import model_registry
+from rate_limiter import INTERACTIVE
 import os
 
-#Cargar las variables de entorno | Load environment variables
-load_dotenv()
-# Configurar las credenciales de Langfuse
-os.environ["LANGFUSE_PUBLIC_KEY"] = "LANGFUSE_PUBLIC_KEY"
-os.environ["LANGFUSE_SECRET_KEY"] = "LANGFUSE_SECRET_KEY"
+logger = logging.getLogger(__name__)
+
+#Modelo por defecto de cada proveedor | Default model of each provider
+DEFAULT_MODELS = {
+    "google": "gemini-1.5-pro",
+    "groq": "mixtral-8x7b-32768",
+    "openai": "gpt-4o",
+}
+
+
 class LLM:
     def __init__(self):
-        self.model_name = "gemini-1.5-pro" #"mixtral-8x7b-32768"#"gpt-4o"
+        self.provider = os.getenv("LLM_PROVIDER", "google")
+        self.model_name = os.getenv("LLM_MODEL", DEFAULT_MODELS.get(self.provider, DEFAULT_MODELS["google"])) #"mixtral-8x7b-32768"#"gpt-4o"
+        self.response_provider = os.getenv("RESPONSE_LLM_PROVIDER", "groq")
+        self.response_model_name = os.getenv("RESPONSE_LLM_MODEL", DEFAULT_MODELS.get(self.response_provider, DEFAULT_MODELS["groq"]))
         self.temperature = 0
         self.max_tokens = None
-        self.llm = self.init_llm()
+        #Las preguntas pasan antes que la ingesta en el limitador | Questions go before the ingestion in the rate limiter
+        self.priority = INTERACTIVE
+
+    @property
+    def llm(self):
+        #The client is shared by the whole process, it is only built the first time it is used
+        return self.init_llm()
 
-    #@observe()
     def init_llm(self):
         
-        llm=ChatGoogleGenerativeAI(
-        model=self.model_name,
+        llm=model_registry.get(
+        self.provider,
+        self.model_name,
         temperature=self.temperature,
-        max_tokens=self.max_tokens
+        max_tokens=self.max_tokens,
+        priority=self.priority
         )
         
         return llm
     
     def response_llm(self):
-        llm=ChatGroq(
-            model="mixtral-8x7b-32768",
+        llm=model_registry.get(
+            self.response_provider,
+            self.response_model_name,
             temperature=self.temperature,
-            max_tokens=self.max_tokens)
+            max_tokens=self.max_tokens,
+            priority=self.priority)
         return llm
  
 
@@ -42,4 +55,4 @@ class LLM:
 """
 https://www.kaggle.com/code/aritrase/langchaincrashcourse-multi-query-retriever-part10/notebook
 https://python.langchain.com/v0.2/docs/integrations/vectorstores/faiss/
-"""
\ No newline at end of file
+"""
@@ -0,0 +1,245 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from collections import deque
+import threading
+import logging
+import json
+import time
+import os
+
+"""
+Métricas de latencia por etapa | Per-stage latency metrics.
+Temporizadores e histogramas ligeros para cada etapa del pipeline (generación de preguntas, embeddings,
+búsquedas, ensamblado del contexto, respuesta del LLM e ingesta), exportables como JSON o en formato
+Prometheus a través de un endpoint HTTP opcional.
+"""
+logger = logging.getLogger(__name__)
+
+#Limites de los buckets del histograma, en segundos | Histogram bucket bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    A latency histogram with fixed buckets and a bounded sample for percentiles.
+    """
+
+    def __init__(self, sample_size=1024):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sample = deque(maxlen=sample_size)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        index = next((i for i, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS))
+        self.buckets[index] += 1
+        self.sample.append(value)
+
+    def percentile(self, q):
+        if not self.sample:
+            return None
+        ordered = sorted(self.sample)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class Metrics:
+    """
+    A thread-safe registry of latency histograms and counters.
+
+    Methods
+    -------
+    timer(name, **labels)
+        Context manager that records the time spent inside it.
+    observe(name, seconds, **labels)
+        Records a latency.
+    increment(name, value, **labels)
+        Adds to a counter.
+    snapshot() -> dict
+        Returns every histogram and counter.
+    to_prometheus() -> str
+        Returns every histogram and counter in the Prometheus text format.
+    export_json(path)
+        Writes the snapshot as JSON.
+    export(force)
+        Writes the snapshot to METRICS_FILE, at most once every METRICS_EXPORT_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._last_export = None
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        """
+        Records a latency, in seconds.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1, **labels):
+        """
+        Adds to a counter.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Context manager that records the time spent inside it, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """
+        Returns every histogram and counter.
+
+        Returns
+        -------
+        dict
+            `histograms` and `counters`, each a list of entries with their name and labels.
+        """
+        with self._lock:
+            return {
+                "histograms": [{"name": name, "labels": dict(labels), **histogram.snapshot()}
+                               for (name, labels), histogram in self._histograms.items()],
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in self._counters.items()],
+            }
+
+    def to_prometheus(self):
+        """
+        Returns every histogram and counter in the Prometheus text format.
+        """
+        def format_labels(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, "+Inf"), histogram.buckets):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export_json(self, path):
+        """
+        Writes the snapshot as JSON.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        #Own temporary file per process and thread, so concurrent exports never write into the same one
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temp_path, path)
+
+    def export(self, force=False):
+        """
+        Writes the snapshot to the METRICS_FILE file, if it is configured.
+
+        It is called after every answer, so the file is rewritten at most once every METRICS_EXPORT_INTERVAL
+        seconds (5 by default) unless `force` is set.
+        """
+        path = os.getenv("METRICS_FILE")
+        if path:
+            interval = float(os.getenv("METRICS_EXPORT_INTERVAL", 5.0))
+            now = time.monotonic()
+            with self._lock:
+                if not force and self._last_export is not None and now - self._last_export < interval:
+                    return
+                self._last_export = now
+            try:
+                self.export_json(path)
+            except OSError as e:
+                logger.warning(f"Could not export the metrics to {path}: {e}")
+
+
+#Registro unico del proceso | Single process-wide registry
+metrics = Metrics()
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None):
+    """
+    Serves the metrics on http://0.0.0.0:<port>/metrics (Prometheus) and /metrics.json, once per process.
+
+    Parameters
+    ----------
+    port : int, optional
+        The port, by default the METRICS_PORT environment variable. Nothing is started if neither is set.
+    """
+    global _server
+    port = port or os.getenv("METRICS_PORT")
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(metrics.snapshot()).encode("utf-8"), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), Handler)
+            except OSError as e:
+                logger.warning(f"Could not start the metrics server on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics-server").start()
+            logger.info(f"Metrics served on port {port}")
+    return _server
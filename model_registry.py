@@ -0,0 +1,130 @@
+from rate_limiter import INTERACTIVE, get_rate_limiter
+from tracing import langfuse_callbacks
+import threading
+import logging
+import time
+
+"""
+Registro de modelos LLM | LLM model registry.
+Crea cada cliente de chat (proveedor, modelo y parámetros) una sola vez por proceso y lo reutiliza en
+todas las peticiones y reruns de Streamlit, en lugar de construir y autenticar un cliente nuevo en cada
+pregunta o en cada PDF. Los clientes de LangChain se pueden invocar desde varios hilos a la vez.
+"""
+logger = logging.getLogger(__name__)
+
+
+def create_chat_model(provider, model_name, temperature=0, max_tokens=None, priority=INTERACTIVE, **kwargs):
+    """
+    Creates a chat model, importing the client library of the provider only when it is chosen.
+    Its calls go through the shared rate limiter of the provider and model, unless RATE_LIMIT=false.
+
+    Parameters
+    ----------
+    provider : str
+        "google", "groq" or "openai".
+    model_name : str
+        The model of the provider.
+    temperature : float, optional
+        Sampling temperature (default is 0).
+    max_tokens : int, optional
+        Maximum number of generated tokens (default is None, no limit).
+    priority : str, optional
+        "interactive" (default) for the questions or "background" for the ingestion.
+    **kwargs
+        Other parameters of the client, for example `timeout` or `max_retries`.
+    """
+    provider = provider.lower()
+    limiter = get_rate_limiter(provider, model_name)
+    callbacks = langfuse_callbacks() or None
+    #With a limiter the callbacks go on the wrapper, which is the model the chains run
+    kwargs = {"model": model_name, "temperature": temperature, "max_tokens": max_tokens,
+              "callbacks": None if limiter else callbacks, **kwargs}
+    if provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        model = ChatGoogleGenerativeAI(**kwargs)
+    elif provider == "groq":
+        from langchain_groq import ChatGroq
+        model = ChatGroq(**kwargs)
+    elif provider == "openai":
+        from langchain_openai import ChatOpenAI
+        model = ChatOpenAI(**kwargs)
+    else:
+        raise ValueError(f"Unknown LLM provider: {provider}")
+    if limiter is None:
+        return model
+    from limited_chat_model import RateLimitedChatModel
+    return RateLimitedChatModel(model=model, limiter=limiter, priority=priority, callbacks=callbacks)
+
+
+class ModelRegistry:
+    """
+    A thread-safe registry of warm chat model clients, keyed by provider, model and parameters.
+
+    Methods
+    -------
+    get(provider, model_name, **params)
+        Returns the shared client, creating it on first use.
+    clear()
+        Drops every client, the next `get` creates them again.
+    stats() -> dict
+        Returns the number of clients, hits and constructions.
+    """
+
+    def __init__(self, factory=create_chat_model):
+        self.factory = factory
+        self._models = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.constructions = 0
+
+    @staticmethod
+    def _key(provider, model_name, params):
+        return provider.lower(), model_name, tuple(sorted((k, repr(v)) for k, v in params.items()))
+
+    def get(self, provider, model_name, **params):
+        """
+        Returns the shared client of a provider, model and parameters, creating it on first use.
+
+        Parameters
+        ----------
+        provider : str
+            "google", "groq" or "openai".
+        model_name : str
+            The model of the provider.
+        **params
+            The client parameters, for example `temperature` and `max_tokens`.
+        """
+        key = self._key(provider, model_name, params)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.hits += 1
+                return model
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        #Build each client once, without blocking the lookups of the other clients
+        with key_lock:
+            with self._lock:
+                model = self._models.get(key)
+            if model is None:
+                start = time.perf_counter()
+                model = self.factory(provider, model_name, **params)
+                with self._lock:
+                    self._models[key] = model
+                    self.constructions += 1
+                logger.info(f"Created the {provider} client of {model_name} in {time.perf_counter() - start:.3f}s")
+            return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._key_locks.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"models": len(self._models), "hits": self.hits, "constructions": self.constructions}
+
+
+#Registro unico del proceso, sobrevive a los reruns de Streamlit | Single process-wide registry, survives Streamlit reruns
+model_registry = ModelRegistry()
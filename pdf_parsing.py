@@ -0,0 +1,39 @@
+import tempfile
+import os
+
+"""
+Lectura de PDFs en procesos aparte | PDF parsing on worker processes.
+Los procesos de lectura se crean con "spawn" e importan solo este módulo, no todo el pipeline de ingesta,
+así que arrancan rápido.
+"""
+
+
+def parse_pdf(data):
+    """
+    Parses the bytes of a PDF into one document per page.
+
+    It is a module level function so it can run on a process pool.
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the PDF file.
+
+    Returns
+    -------
+    list
+        The pages of the PDF.
+    """
+
+    #creating a temporaly file to stora the content of the load file
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+        temp_file.write(data)
+        doc = temp_file.name
+
+    try:
+        #Load and read the pdf, the loader is imported here so the app does not load it on startup
+        from langchain_community.document_loaders import PyPDFLoader
+        return PyPDFLoader(doc).load()
+    finally:
+        # Asegurarse de eliminar el archivo temporal
+        os.unlink(doc)
@@ -35,9 +35,9 @@ class Prompt:
             
         )
         
+        #The context is only sent once, in the system message
         human_prompt = (
-            "Please answer the following questions based on the given context:\n"
-            "{context}\n\n"
+            "Please answer the following questions based on the given context.\n\n"
             "User's next questions: {question}"
             )
         
@@ -0,0 +1,282 @@
+from qdrant_client import QdrantClient, AsyncQdrantClient
+import threading
+import asyncio
+import logging
+import httpx
+import time
+
+"""
+Registro de clientes de Qdrant compartido por todo el proceso | Process-wide Qdrant client registry.
+Cada combinación de (host, puerto, transporte) tiene un único cliente con conexiones keep-alive,
+que se reutiliza en VectorDB, ConsultDB e IngestData en lugar de abrir una conexión por llamada.
+"""
+logger = logging.getLogger(__name__)
+
+
+class QdrantClientPool:
+    """
+    A thread-safe registry that hands out one shared, pooled QdrantClient per endpoint.
+
+    Attributes
+    ----------
+    health_check_interval : float
+        Seconds between health checks of a cached client.
+    max_connections : int
+        Maximum number of HTTP connections kept by each REST client.
+    max_keepalive_connections : int
+        Maximum number of idle keep-alive connections kept by each REST client.
+    keepalive_expiry : float
+        Seconds an idle keep-alive connection is kept open.
+
+    Methods
+    -------
+    get_client(host, port, grpc_port, prefer_grpc, timeout, location) -> QdrantClient
+        Returns the shared client for an endpoint, creating or reconnecting it if needed.
+    reconnect(host, port, grpc_port, prefer_grpc, timeout, location) -> QdrantClient
+        Drops the cached client for an endpoint and builds a new one.
+    close_all()
+        Closes every cached client.
+    """
+
+    def __init__(self, health_check_interval=30.0, max_connections=20,
+                 max_keepalive_connections=10, keepalive_expiry=30.0):
+        self.health_check_interval = health_check_interval
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._clients = {}
+        self._last_check = {}
+        self._lock = threading.Lock()
+
+    def _create_client(self, host, port, grpc_port, prefer_grpc, timeout, location=None):
+        """
+        Builds a new QdrantClient with keep-alive connection pooling.
+
+        Returns
+        -------
+        QdrantClient
+            A new client for the endpoint.
+        """
+        if location:
+            #Local in-process mode, in memory (":memory:") or persisted in a folder
+            if location == ":memory:":
+                client = QdrantClient(location=location)
+            else:
+                client = QdrantClient(path=location)
+            logger.info(f"Qdrant running in local mode ({location})")
+            return client
+
+        if prefer_grpc:
+            #gRPC keeps a single multiplexed channel open, no HTTP pool is needed
+            client = QdrantClient(host=host, port=port, grpc_port=grpc_port,
+                                  prefer_grpc=True, timeout=int(timeout))
+        else:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            client = QdrantClient(host=host, port=port, prefer_grpc=False,
+                                  timeout=int(timeout), limits=limits)
+        logger.info(f"succesful connection with Qdrant {host}:{grpc_port if prefer_grpc else port} (grpc={prefer_grpc})")
+        return client
+
+    @staticmethod
+    def _key(host, port, grpc_port, prefer_grpc, timeout, location):
+        return host, port, grpc_port, prefer_grpc, timeout, location
+
+    def _is_healthy(self, client):
+        """
+        Checks if a cached client can still reach the Qdrant server.
+        """
+        try:
+            client.get_collections()
+            return True
+        except Exception as e:
+            logger.warning(f"Qdrant health check failed: {e}")
+            return False
+
+    def get_client(self, host, port, grpc_port=6334, prefer_grpc=False, timeout=30.0, location=None):
+        """
+        Returns the shared client for an endpoint, creating or reconnecting it if needed.
+
+        Parameters
+        ----------
+        host : str
+            Host of the Qdrant server.
+        port : int
+            REST port of the Qdrant server.
+        grpc_port : int, optional
+            gRPC port of the Qdrant server (default is 6334).
+        prefer_grpc : bool, optional
+            Use the gRPC transport instead of REST (default is False).
+        timeout : float, optional
+            Request timeout in seconds (default is 30.0).
+        location : str, optional
+            ":memory:" or a folder to run Qdrant in local in-process mode instead of connecting to a server.
+
+        Returns
+        -------
+        QdrantClient
+            The shared client for the endpoint.
+        """
+        key = self._key(host, port, grpc_port, prefer_grpc, timeout, location)
+        with self._lock:
+            client = self._clients.get(key)
+            now = time.monotonic()
+
+            #A local client has no server to lose, and reconnecting would drop an in-memory database
+            if client is not None and (location or now - self._last_check.get(key, 0.0) < self.health_check_interval):
+                return client
+
+            if client is None:
+                client = self._create_client(host, port, grpc_port, prefer_grpc, timeout, location)
+                self._clients[key] = client
+                self._last_check[key] = now
+                return client
+
+            #This thread takes the health check, the others keep using the client until it is done
+            self._last_check[key] = now
+
+        #The check is a network call, it runs outside the lock so other endpoints are not blocked
+        if self._is_healthy(client):
+            return client
+
+        logger.info(f"Reconnecting Qdrant client {host}:{port}")
+        replacement = self._create_client(host, port, grpc_port, prefer_grpc, timeout, location)
+        with self._lock:
+            if self._clients.get(key) is client:
+                self._clients[key] = replacement
+                stale = client
+            else:
+                #Another thread already replaced it, keep its client
+                stale, replacement = replacement, self._clients.get(key)
+        self._close(stale)
+        if replacement is None:
+            return self.get_client(host, port, grpc_port, prefer_grpc, timeout, location)
+        return replacement
+
+    def reconnect(self, host, port, grpc_port=6334, prefer_grpc=False, timeout=30.0, location=None):
+        """
+        Drops the cached client for an endpoint and builds a new one.
+
+        Returns
+        -------
+        QdrantClient
+            The new shared client for the endpoint.
+        """
+        key = self._key(host, port, grpc_port, prefer_grpc, timeout, location)
+        with self._lock:
+            client = self._clients.pop(key, None)
+            self._last_check.pop(key, None)
+            if client is not None:
+                self._close(client)
+        return self.get_client(host, port, grpc_port, prefer_grpc, timeout, location)
+
+    def _close(self, client):
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"Error closing Qdrant client: {e}")
+
+    def close_all(self):
+        """
+        Closes every cached client.
+        """
+        with self._lock:
+            for client in self._clients.values():
+                self._close(client)
+            self._clients.clear()
+            self._last_check.clear()
+
+
+#Registro unico del proceso | Single process-wide registry
+qdrant_pool = QdrantClientPool()
+
+
+def get_qdrant_client(host, port, grpc_port=6334, prefer_grpc=False, timeout=30.0, location=None):
+    """
+    Returns the process-wide shared client for a Qdrant endpoint.
+    """
+    return qdrant_pool.get_client(host, port, grpc_port=grpc_port, prefer_grpc=prefer_grpc, timeout=timeout,
+                                  location=location)
+
+
+class AsyncQdrantClientPool:
+    """
+    A registry that hands out one shared AsyncQdrantClient per endpoint.
+
+    Async clients keep their connections bound to the event loop that created them. The retrieval runs on
+    the process-wide background loop, so each endpoint has one client for the life of the process. If a
+    client is asked for from another loop, the old client is closed before it is replaced.
+
+    Methods
+    -------
+    get_client(host, port, grpc_port, prefer_grpc, timeout) -> AsyncQdrantClient
+        Returns the shared async client for an endpoint in the running event loop.
+    """
+
+    def __init__(self, max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _close(self, loop, client):
+        #The client can only be closed on the loop that owns its connections
+        try:
+            if not loop.is_closed() and loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.close(), loop)
+            elif not loop.is_closed():
+                loop.run_until_complete(client.close())
+            else:
+                logger.warning("Dropped an async Qdrant client whose event loop is already closed")
+        except Exception as e:
+            logger.warning(f"Error closing async Qdrant client: {e}")
+
+    def get_client(self, host, port, grpc_port=6334, prefer_grpc=False, timeout=30.0):
+        """
+        Returns the shared async client for an endpoint in the running event loop.
+
+        Must be called from inside a running event loop.
+
+        Returns
+        -------
+        AsyncQdrantClient
+            The shared async client for the endpoint.
+        """
+        loop = asyncio.get_running_loop()
+        key = (host, port, grpc_port, prefer_grpc, timeout)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                if entry[0] is loop:
+                    return entry[1]
+                logger.info(f"Replacing the async Qdrant client {host}:{port} of another event loop")
+                self._close(*entry)
+
+            if prefer_grpc:
+                client = AsyncQdrantClient(host=host, port=port, grpc_port=grpc_port,
+                                           prefer_grpc=True, timeout=int(timeout))
+            else:
+                limits = httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                )
+                client = AsyncQdrantClient(host=host, port=port, prefer_grpc=False,
+                                           timeout=int(timeout), limits=limits)
+            self._clients[key] = (loop, client)
+            return client
+
+
+#Registro unico de clientes asincronos | Single async client registry
+async_qdrant_pool = AsyncQdrantClientPool()
+
+
+def get_async_qdrant_client(host, port, grpc_port=6334, prefer_grpc=False, timeout=30.0):
+    """
+    Returns the shared async client for a Qdrant endpoint in the running event loop.
+    """
+    return async_qdrant_pool.get_client(host, port, grpc_port=grpc_port, prefer_grpc=prefer_grpc, timeout=timeout)
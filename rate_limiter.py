@@ -0,0 +1,314 @@
+from metrics import metrics
+import threading
+import asyncio
+import logging
+import random
+import json
+import time
+import os
+
+"""
+Limitador de peticiones compartido | Shared rate limiter.
+Un limitador por proveedor y modelo (Gemini, Groq, ...) para todo el proceso, con presupuesto de peticiones y de
+tokens por minuto (token bucket), concurrencia adaptativa (AIMD: sube de uno en uno mientras todo va bien y se
+reduce a la mitad ante un 429 o una latencia alta), reintentos con backoff aleatorio ante los 429 y prioridad de
+las preguntas de los usuarios ("interactive") sobre la ingesta en segundo plano ("background").
+"""
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+"""
+Límites por defecto | Default limits.
+Claves "proveedor:modelo" o "proveedor"; rpm y tpm son peticiones y tokens por minuto (None sin límite),
+max_concurrency el techo de la concurrencia adaptativa. La variable de entorno RATE_LIMITS (JSON con las
+mismas claves) los sobrescribe.
+"""
+RATE_LIMITS = {
+    "default": {"rpm": 60, "tpm": 1_000_000, "max_concurrency": 8},
+    "google": {"rpm": 360, "tpm": 4_000_000, "max_concurrency": 8},
+    "google:models/embedding-001": {"rpm": 1500, "tpm": None, "max_concurrency": 16},
+    "groq": {"rpm": 30, "tpm": 5_000, "max_concurrency": 4},
+    "openai": {"rpm": 500, "tpm": 30_000, "max_concurrency": 8},
+}
+
+
+def is_rate_limit_error(error):
+    """
+    Returns whether an error of a provider client is a 429 / quota exhausted response.
+    """
+    for attribute in ("status_code", "code", "status"):
+        if getattr(error, attribute, None) == 429:
+            return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "RateLimitError", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "resource exhausted" in message
+
+
+class TokenBucket:
+    """
+    A bucket refilled at `per_minute / 60` units per second, up to `per_minute` units.
+    Not thread-safe by itself, the limiter holds its lock.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, reserve=0.0, now=None):
+        """
+        Returns the seconds until `amount` units can be taken while leaving `reserve` units, 0 if they can now.
+        """
+        self._refill(now or time.monotonic())
+        #A single call larger than the bucket only waits for a full bucket
+        amount = min(amount, self.capacity - reserve)
+        missing = amount + reserve - self.available
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        self.available -= min(amount, self.capacity)
+
+    def charge(self, amount):
+        #Units learned after the call, for example the output tokens; the bucket may go into debt
+        self.available -= amount
+
+
+class RateLimiter:
+    """
+    A process-wide rate limiter of one provider and model.
+
+    Attributes
+    ----------
+    name : str
+        "provider:model".
+    limit : float
+        Current adaptive concurrency limit, between `min_concurrency` and `max_concurrency`.
+    latency_target : float
+        Seconds above which a call counts as a slowdown and the concurrency is reduced a little.
+    background_reserve : float
+        Share of each budget that background calls leave free for interactive ones.
+    max_retries : int
+        Retries of a call rejected with a 429.
+
+    Methods
+    -------
+    call(function, tokens, priority)
+        Runs `function()` within the limits, retrying it with jittered backoff on 429.
+    acall(function, tokens, priority)
+        Asynchronous version of `call` for coroutine functions.
+    acquire(tokens, priority) / release(latency, throttled)
+        Takes and returns a slot, for calls that cannot be wrapped in a function, such as streams.
+    charge(tokens)
+        Counts tokens learned after the call, such as the output tokens.
+    retry_delay(error, attempt) -> float
+        Returns the jittered wait before retrying a throttled call, or None if the error has to be raised.
+    stats() -> dict
+        Returns the current limit, the calls in flight and the waiting calls.
+    """
+
+    def __init__(self, name, rpm=None, tpm=None, max_concurrency=8, min_concurrency=1,
+                 latency_target=None, background_reserve=None, max_retries=None):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.latency_target = latency_target or float(os.getenv("RATE_LIMIT_LATENCY_TARGET", 20.0))
+        self.background_reserve = (background_reserve if background_reserve is not None
+                                   else float(os.getenv("RATE_LIMIT_BACKGROUND_RESERVE", 0.2)))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("RATE_LIMIT_MAX_RETRIES", 5))
+        self.base_backoff = float(os.getenv("RATE_LIMIT_BACKOFF", 1.0))
+        self.max_backoff = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", 30.0))
+        self.in_flight = 0
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._condition = threading.Condition()
+
+    def _budget_wait(self, tokens, priority):
+        #Seconds until both budgets allow the call; background calls leave a share free for interactive ones
+        now = time.monotonic()
+        waits = []
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None and amount:
+                reserve = bucket.capacity * self.background_reserve if priority == BACKGROUND else 0.0
+                waits.append(bucket.wait_time(amount, reserve, now))
+        return max(waits, default=0.0)
+
+    def acquire(self, tokens=0, priority=INTERACTIVE):
+        """
+        Waits for a concurrency slot and for the request and token budgets, interactive calls first.
+        """
+        start = time.perf_counter()
+        with self._condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    has_slot = self.in_flight < max(1, int(self.limit))
+                    has_turn = priority == INTERACTIVE or self.waiting[INTERACTIVE] == 0
+                    if has_slot and has_turn:
+                        wait = self._budget_wait(tokens, priority)
+                        if wait <= 0:
+                            break
+                        self._condition.wait(timeout=wait)
+                    else:
+                        self._condition.wait(timeout=1.0)
+                self.in_flight += 1
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None and tokens:
+                    self.tokens.take(tokens)
+            finally:
+                self.waiting[priority] -= 1
+                self._condition.notify_all()
+        metrics.observe("rate_limiter_wait_seconds", time.perf_counter() - start, limiter=self.name, priority=priority)
+
+    def release(self, latency=None, throttled=False):
+        """
+        Returns a slot and adapts the concurrency limit (AIMD): halved on a 429, reduced a little when the
+        call was slower than `latency_target`, and increased by about one per round of successful calls.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                logger.warning(f"{self.name} rate limited, concurrency limit lowered to {self.limit:.1f}")
+            elif latency is not None and latency > self.latency_target:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+            elif latency is not None:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def charge(self, tokens):
+        """
+        Counts tokens learned after the call, such as the output tokens.
+        """
+        if self.tokens is not None and tokens:
+            with self._condition:
+                self.tokens.charge(tokens)
+
+    def _backoff(self, attempt):
+        #Full jitter, so the throttled callers do not retry all at once
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def retry_delay(self, error, attempt):
+        #Returns the seconds to wait before retrying a throttled call, or None to raise the error
+        if not is_rate_limit_error(error) or attempt >= self.max_retries:
+            return None
+        metrics.increment("rate_limit_retries_total", limiter=self.name)
+        return self._backoff(attempt)
+
+    def call(self, function, tokens=0, priority=INTERACTIVE):
+        """
+        Runs `function()` within the limits, retrying it with jittered backoff when the provider answers 429.
+
+        Parameters
+        ----------
+        function : callable
+            The call to the provider.
+        tokens : int, optional
+            Estimated tokens of the call, taken from the token budget.
+        priority : str, optional
+            "interactive" (default) or "background".
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens, priority)
+            start = time.perf_counter()
+            try:
+                result = function()
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                self.release(time.perf_counter() - start if not throttled else None, throttled)
+                if throttled:
+                    metrics.increment("rate_limited_total", limiter=self.name)
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.release(time.perf_counter() - start)
+            return result
+
+    async def _aacquire(self, tokens, priority):
+        #Wait on a worker thread; if the caller is cancelled meanwhile, the slot is returned once taken
+        pending = asyncio.ensure_future(asyncio.to_thread(self.acquire, tokens, priority))
+        try:
+            await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            pending.add_done_callback(lambda task: task.cancelled() or task.exception() or self.release())
+            raise
+
+    async def acall(self, function, tokens=0, priority=INTERACTIVE):
+        """
+        Asynchronous version of `call`: awaits `function()` within the limits.
+        """
+        attempt = 0
+        while True:
+            await self._aacquire(tokens, priority)
+            start = time.perf_counter()
+            try:
+                result = await function()
+            except asyncio.CancelledError:
+                self.release()
+                raise
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                self.release(time.perf_counter() - start if not throttled else None, throttled)
+                if throttled:
+                    metrics.increment("rate_limited_total", limiter=self.name)
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.release(time.perf_counter() - start)
+            return result
+
+    def stats(self):
+        with self._condition:
+            return {"limit": self.limit, "in_flight": self.in_flight, "waiting": dict(self.waiting)}
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _configured_limits():
+    limits = {key: dict(value) for key, value in RATE_LIMITS.items()}
+    try:
+        for key, value in json.loads(os.getenv("RATE_LIMITS", "{}")).items():
+            limits.setdefault(key, {}).update(value)
+    except ValueError as e:
+        logger.warning(f"Could not read RATE_LIMITS: {e}")
+    return limits
+
+
+def get_rate_limiter(provider, model):
+    """
+    Returns the process-wide rate limiter of a provider and model, or None if RATE_LIMIT=false.
+
+    The limits are the first of "provider:model", "provider" and "default" found in RATE_LIMITS.
+    """
+    if os.getenv("RATE_LIMIT", "true").lower() != "true":
+        return None
+    name = f"{provider.lower()}:{model}"
+    with _limiters_lock:
+        if name not in _limiters:
+            limits = _configured_limits()
+            config = {**limits["default"], **limits.get(provider.lower(), {}), **limits.get(name, {})}
+            _limiters[name] = RateLimiter(name, rpm=config.get("rpm"), tpm=config.get("tpm"),
+                                          max_concurrency=config.get("max_concurrency", 8))
+        return _limiters[name]
@@ -1,6 +1,8 @@
 from langchain_core.output_parsers import CommaSeparatedListOutputParser
 from llm import LLM
 from prompt import Prompt
+from singleflight import query_generation_flight, normalize
+import os
 
 class Retriever_QA(LLM, Prompt):
     """
@@ -10,6 +12,8 @@ class Retriever_QA(LLM, Prompt):
     ----------
     question : str
         The question to be processed.
+    query_model : str
+        "main" to generate the questions with `init_llm`, or "response" to use the faster `response_llm`.
 
     Methods
     -------
@@ -29,13 +33,22 @@ class Retriever_QA(LLM, Prompt):
  
         self.question=question
         super().__init__()
+        self.query_model = os.getenv("QUERY_GENERATION_MODEL", "main")
+
+    def query_llm(self):
+        """
+        Returns the model used to generate the questions, chosen with QUERY_GENERATION_MODEL.
+        """
+        if self.query_model == "response":
+            return self.response_llm()
+        return self.init_llm()
         
     def generate_questions(self):
         """
         Generates a list of questions based on the input question using a language model and a prompt template.
 
         This method initializes the language model, sets up the prompt template, and processes the input question
-        to generate a list of related questions.
+        to generate a list of related questions. Concurrent calls for the same question share one LLM call.
 
         Returns
         -------
@@ -43,9 +56,9 @@ class Retriever_QA(LLM, Prompt):
             A list of generated questions.
         """
          
-        llm = self.init_llm()
+        llm = self.query_llm()
         QUERY_PROMPT = self.prompt_template()
         output_parser = CommaSeparatedListOutputParser() #LineListOutputParser()
         llm_chain = QUERY_PROMPT|llm| output_parser #StrOutputParser()  #
-        result = llm_chain.invoke(self.question)
-        return result
+        result = query_generation_flight.do((self.query_model, normalize(self.question)), llm_chain.invoke, self.question)
+        return list(result)
@@ -0,0 +1,212 @@
+from concurrent.futures import Future
+from metrics import metrics
+from array import array
+import threading
+import hashlib
+import asyncio
+import logging
+import os
+
+"""
+Agrupación de llamadas en curso | In-flight call coalescing (single-flight).
+Cuando varias peticiones hacen la misma llamada costosa a la vez (la misma pregunta normalizada), solo
+la primera la ejecuta y las demás esperan y reciben su resultado. Se usa en la generación de preguntas,
+el embedding de las consultas, las búsquedas en las colecciones y la generación de la respuesta, también
+cuando la respuesta se transmite token a token: los demás reciben los tokens ya generados y los siguientes.
+"""
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    """
+    Normalizes a question so trivially different requests share the same key.
+    """
+    return " ".join(str(text).lower().split())
+
+
+def vector_key(vector):
+    """
+    Returns a short key of a query vector.
+    """
+    return hashlib.sha1(array("f", vector).tobytes()).hexdigest()
+
+
+class _Broadcast:
+    """
+    The items yielded by a leader stream, replayed to every follower as they arrive.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self._condition = threading.Condition()
+
+    def append(self, item):
+        with self._condition:
+            self.items.append(item)
+            self._condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._condition:
+            self.done, self.result, self.error = True, result, error
+            self._condition.notify_all()
+
+    def replay(self):
+        #Yields the recorded items and then the new ones, and returns the result of the leader stream
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.items) and not self.done:
+                    self._condition.wait()
+                if index < len(self.items):
+                    item = self.items[index]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return self.result
+            index += 1
+            yield item
+
+
+class SingleFlight:
+    """
+    Coalesces the concurrent calls with the same key into a single call, from threads or event loops.
+
+    Attributes
+    ----------
+    stage : str
+        Name of the pipeline stage, used in the metrics.
+    enabled : bool
+        Whether the calls are coalesced, set with SINGLE_FLIGHT (default "true").
+
+    Methods
+    -------
+    do(key, function, *args, **kwargs)
+        Runs `function`, or waits for the call with the same key that is already running.
+    ado(key, function, *args, **kwargs)
+        Asynchronous version of `do` for coroutine functions.
+    stream(key, function, *args, **kwargs)
+        Generator version of `do`: the followers get the items already yielded by the running stream, then the next ones.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.enabled = os.getenv("SINGLE_FLIGHT", "true").lower() == "true"
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        #Returns the shared future of the key and whether this caller has to run the call
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        metrics.increment("singleflight_calls_total", stage=self.stage)
+        if not leader:
+            metrics.increment("singleflight_coalesced_total", stage=self.stage)
+        return future, leader
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Runs `function`, or waits for the call with the same key that is already running and returns its result.
+        The error of the call is raised in every caller.
+        """
+        if not self.enabled:
+            return function(*args, **kwargs)
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def ado(self, key, function, *args, **kwargs):
+        """
+        Asynchronous version of `do`: awaits `function(*args, **kwargs)`, or the call with the same key
+        already running in this or another event loop.
+        """
+        if not self.enabled:
+            return await function(*args, **kwargs)
+        future, leader = self._join(key)
+        if not leader:
+            #Shielded, so a follower that times out does not cancel the shared call
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await function(*args, **kwargs)
+        except asyncio.CancelledError:
+            #The leader was cancelled, for example by its timeout: the followers get a timeout, not a cancellation
+            self._finish(key, future, error=asyncio.TimeoutError(f"The {self.stage} call was cancelled"))
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+
+    def stream(self, key, function, *args, **kwargs):
+        """
+        Generator version of `do`: runs the generator `function`, or replays the one with the same key that is
+        already running, yielding its items as they arrive. Returns the return value of the generator.
+
+        If the consumer of the running stream stops early, the followers get a TimeoutError.
+        """
+        if not self.enabled:
+            return (yield from function(*args, **kwargs))
+        with self._lock:
+            broadcast = self._streams.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._streams[key] = _Broadcast()
+        metrics.increment("singleflight_calls_total", stage=self.stage)
+        if not leader:
+            metrics.increment("singleflight_coalesced_total", stage=self.stage)
+            return (yield from broadcast.replay())
+
+        error, result = None, None
+        try:
+            generator = function(*args, **kwargs)
+            while True:
+                try:
+                    item = next(generator)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                broadcast.append(item)
+                yield item
+        except GeneratorExit:
+            error = asyncio.TimeoutError(f"The {self.stage} stream was abandoned")
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            with self._lock:
+                self._streams.pop(key, None)
+            broadcast.finish(result, error)
+        return result
+
+
+#Una instancia por etapa del pipeline | One instance per pipeline stage
+query_generation_flight = SingleFlight("query_generation")
+embedding_flight = SingleFlight("query_embedding")
+search_flight = SingleFlight("search")
+answer_flight = SingleFlight("answer")
@@ -0,0 +1,34 @@
+import sqlite3
+import os
+
+"""
+Archivos SQLite locales | Local SQLite files.
+Apertura común de los archivos SQLite de la caché de embeddings, el índice léxico y el almacén de documentos
+padre: crea la carpeta, abre una conexión compartida entre hilos y crea el esquema si falta.
+"""
+
+
+def open_sqlite(path, *schema):
+    """
+    Opens a SQLite file with one connection shared by the threads, which hold their own lock around it.
+
+    Parameters
+    ----------
+    path : str
+        Path of the SQLite file, its folder is created if needed.
+    *schema : str
+        "CREATE ... IF NOT EXISTS" statements run once the file is open.
+
+    Returns
+    -------
+    sqlite3.Connection
+        The open connection.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    return conn
@@ -0,0 +1,43 @@
+import sys
+import os
+
+import pytest
+
+#The project modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Importing the benchmark configures its offline stand-ins before the project modules read the environment:
+#Qdrant in local mode, the "fake" embedding provider and the cache files in a temporary folder
+import benchmark  # noqa: E402
+
+from embeddings import register_embedding_provider  # noqa: E402
+
+register_embedding_provider("fake", benchmark.HashEmbeddingProvider())
+
+
+class CountingProvider(benchmark.HashEmbeddingProvider):
+
+    def __init__(self):
+        super().__init__()
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def offline_ingest(monkeypatch, tmp_path):
+    """
+    Ingestion with the offline stand-ins, into a Qdrant of its own; returns the embedding provider, which counts
+    the embedded chunks.
+    """
+    import llm
+
+    provider = CountingProvider()
+    register_embedding_provider("counting", provider)
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "counting")
+    monkeypatch.setenv("QDRANT_LOCATION", str(tmp_path / "qdrant"))
+    fake_llm = benchmark.FakeChatModel()
+    monkeypatch.setattr(llm.LLM, "init_llm", lambda self: fake_llm)
+    return provider
@@ -0,0 +1,59 @@
+from fastapi.testclient import TestClient
+
+import api
+
+
+def test_batch_limit_fits_the_admission_queue():
+    assert api.max_batch <= api.questions_pool.max_concurrency + api.questions_pool.max_queue
+
+
+def test_batch_larger_than_the_queue_is_rejected_for_good():
+    #413 and not a 503 with Retry-After, which a client would retry forever
+    client = TestClient(api.app)
+    response = client.post("/ask_batch", json={"questions": ["question"] * (api.max_batch + 1)})
+    assert response.status_code == 413
+    assert api.questions_pool.pending == 0
+
+
+def test_a_failed_question_is_reported_without_failing_the_batch(monkeypatch):
+    def answer(question):
+        if question == "broken":
+            raise RuntimeError("the model is down")
+        return api.AskResponse(question=question, answer="ok", seconds=0.0)
+
+    monkeypatch.setattr(api, "_answer", answer)
+    client = TestClient(api.app)
+    response = client.post("/ask_batch", json={"questions": ["first", "broken", "last"]})
+    assert response.status_code == 200
+    answers = response.json()["answers"]
+    assert [answer["answer"] for answer in answers] == ["ok", "", "ok"]
+    assert answers[1]["error"] == "the model is down"
+    assert api.questions_pool.pending == 0
+
+
+def test_a_streamed_question_releases_its_reservation(monkeypatch):
+    import chatbot
+
+    class StreamingChatbot:
+        def __init__(self, question):
+            self.question = question
+
+        def stream(self):
+            yield from ("an ", "answer")
+
+    monkeypatch.setattr(chatbot, "Chatbot", StreamingChatbot)
+    client = TestClient(api.app)
+    response = client.post("/ask/stream", json={"question": "question"})
+    assert response.text == "an answer"
+    assert api.questions_pool.pending == 0
+
+
+def test_uploaded_pdf_reads_the_spooled_file_in_place():
+    import io
+    from fastapi import UploadFile
+
+    upload = UploadFile(io.BytesIO(b"%PDF-1.4 content"), filename="report.pdf", size=16)
+    upload.file.read()
+    document = api.UploadedPDF(upload)
+    assert document.name == "report.pdf" and document.size == 16
+    assert document.read() == b"%PDF-1.4 content"
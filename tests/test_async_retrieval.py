@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from async_loop import background_loop
+from consult_db import ConsultDB
+from db import VectorDB
+from embeddings import GeminiEmbeddingProvider, register_embedding_provider
+from qdrant_pool import async_qdrant_pool
+
+
+class LoopBoundGenai:
+    """
+    Stands in for google.generativeai over the network: like its grpc.aio client, the async API
+    is bound to the first event loop that uses it and fails from any other loop.
+    """
+
+    def __init__(self, dimension=8):
+        self.dimension = dimension
+        self.loop = None
+        self.calls = 0
+
+    def _vectors(self, content):
+        self.calls += 1
+        return {"embedding": [[float(len(text) % 7 + i) for i in range(self.dimension)] for text in content]}
+
+    def embed_content(self, model, content, task_type):
+        return self._vectors(content)
+
+    async def embed_content_async(self, model, content, task_type):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        elif self.loop is not loop:
+            raise RuntimeError("Event loop is closed")
+        return self._vectors(content)
+
+
+@pytest.fixture
+def gemini_provider(monkeypatch):
+    provider = GeminiEmbeddingProvider(model="models/embedding-001")
+    provider._genai = LoopBoundGenai()
+    register_embedding_provider("gemini-test", provider)
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "gemini-test")
+    monkeypatch.setenv("LEXICAL_SEARCH", "false")
+    VectorDB(text=None).bootstrap()
+    return provider
+
+
+def test_async_retrieval_embeds_every_request(gemini_provider):
+    #Without the lexical fallback a failed query embedding raises, so every request must embed
+    for question in ("first question", "second longer question", "third question of all"):
+        documents = ConsultDB(questions=[question]).get_all_document_async()
+        assert set(documents[0]) == {"summaries", "splits"}
+    assert gemini_provider._genai.calls >= 3
+
+
+def test_async_retrieval_from_another_loop(gemini_provider):
+    #Awaited from the caller's own loop, the work still runs on the shared background loop
+    documents = asyncio.run(ConsultDB(questions=["a question awaited directly"]).aget_all_document())
+    assert set(documents[0]) == {"summaries", "splits"}
+
+
+def test_async_qdrant_client_is_reused_across_requests():
+    async def get_client():
+        return async_qdrant_pool.get_client("localhost", 6333)
+
+    first = background_loop.run(get_client())
+    second = background_loop.run(get_client())
+    assert first is second
+
+
+def test_async_retrieval_keeps_sqlite_work_off_the_event_loop(monkeypatch, tmp_path):
+    import threading
+    import consult_db
+
+    threads = []
+
+    def record(result):
+        def call(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return result(*args) if callable(result) else result
+        return call
+
+    monkeypatch.setenv("QDRANT_LOCATION", str(tmp_path / "qdrant"))
+    monkeypatch.setenv("LEXICAL_SEARCH", "true")
+    VectorDB(text=None).bootstrap()
+    monkeypatch.setattr(consult_db.lexical_index, "search", record([]))
+    monkeypatch.setattr(consult_db.embedding_cache, "get_many", record(lambda model, task, texts: [None] * len(texts)))
+    monkeypatch.setattr(consult_db.embedding_cache, "set_many", record(None))
+
+    documents = ConsultDB(["What is the vector index?", "Which model answers?"]).get_all_document_async()
+
+    assert [set(question) >= {"lexical"} for question in documents] == [True, True]
+    assert len(threads) == 4
+    assert background_loop.name not in threads
@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+import benchmark
+import llm
+from answer_cache import answer_cache
+
+
+class CountingChatModel(benchmark.FakeChatModel):
+    answers: list = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        if "Original question:" not in (messages[-1].content if messages else ""):
+            self.answers.append(1)
+        return super()._call(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+@pytest.fixture
+def counting_llm(monkeypatch, tmp_path):
+    monkeypatch.setenv("QDRANT_LOCATION", str(tmp_path / "qdrant"))
+    model = CountingChatModel(latency=0.3, answers=[])
+    monkeypatch.setattr(llm.LLM, "init_llm", lambda self: model)
+    monkeypatch.setattr(llm.LLM, "response_llm", lambda self: model)
+    #Without the answer cache only the single-flight can spare the repeated answers
+    monkeypatch.setattr(answer_cache, "lookup", lambda vector: None)
+    return model
+
+
+def test_concurrent_streams_of_the_same_question_call_the_llm_once(counting_llm):
+    from chatbot import Chatbot
+    from db import VectorDB
+
+    VectorDB(text=None).bootstrap()
+    answers = []
+    barrier = threading.Barrier(4)
+
+    def ask():
+        chatbot = Chatbot("What is the latency of the vector index?")
+        barrier.wait()
+        answers.append("".join(chatbot.stream()))
+
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(answers) == 4 and len(set(answers)) == 1
+    assert len(counting_llm.answers) == 1
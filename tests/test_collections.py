@@ -0,0 +1,66 @@
+import pytest
+
+from db import VectorDB
+from embeddings import EmbeddingProvider, register_embedding_provider
+
+
+class FixedProvider(EmbeddingProvider):
+
+    def __init__(self, size):
+        self.size = size
+        self.name = f"fixed-{size}"
+
+    def embed_documents(self, texts):
+        return [[1.0] * self.size for _ in texts]
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+    def dimension(self):
+        return self.size
+
+
+def test_switching_to_a_provider_of_another_dimension_fails_fast(monkeypatch, tmp_path):
+    register_embedding_provider("fixed-768", FixedProvider(768))
+    register_embedding_provider("fixed-384", FixedProvider(384))
+    monkeypatch.setenv("QDRANT_LOCATION", str(tmp_path))
+
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "fixed-768")
+    VectorDB(text=None).create_vectordb()
+
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "fixed-384")
+    with pytest.raises(ValueError, match="dimension 768"):
+        VectorDB(text=None).create_vectordb()
+
+
+def test_incomplete_provider_fails_when_created():
+    class QueriesOnly(EmbeddingProvider):
+        def embed_queries(self, texts):
+            return []
+
+    with pytest.raises(TypeError):
+        QueriesOnly()
+
+
+def test_storage_profiles_change_existing_collections_only_when_asked(monkeypatch, tmp_path):
+    register_embedding_provider("fixed-8", FixedProvider(8))
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "fixed-8")
+    monkeypatch.setenv("QDRANT_LOCATION", str(tmp_path))
+    VectorDB(text=None).create_vectordb()
+
+    vector_db = VectorDB(text=None)
+    vector_db.storage_profiles["Documents"]["on_disk"] = False
+    client = vector_db.check_connection_qdrant()
+    updates = []
+    monkeypatch.setattr(client, "update_collection", lambda **kwargs: updates.append(kwargs))
+
+    #Creating the missing collections does not rebuild the existing ones
+    vector_db.create_vectordb()
+    assert updates == []
+
+    changes = vector_db.apply_storage_profiles()
+    assert changes == {"Documents": {"on_disk": False}, "Summary": {}, "Splited_text": {}}
+    assert [update["collection_name"] for update in updates] == ["Documents"]
+    #The whole profile is applied, on_disk included
+    assert updates[0]["vectors_config"][""].on_disk is False
+    assert updates[0]["hnsw_config"] is None
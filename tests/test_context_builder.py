@@ -0,0 +1,56 @@
+from langchain_core.documents import Document
+
+from context_builder import ContextBuilder
+from docstore import docstore, parent_id
+from tokens import count_tokens
+
+
+def doc(text, score=1.0, collection="Splited_text", **metadata):
+    return Document(page_content=text, metadata={"score": score, "collection": collection, **metadata})
+
+
+def test_chunks_found_by_several_lists_rank_first_and_appear_once():
+    builder = ContextBuilder(rrf_k=60)
+    results = [
+        {"Splited_text": [doc("alpha", 0.9), doc("beta", 0.8)], "Summary": [doc("gamma", 0.7, "Summary")]},
+        {"Splited_text": [doc("beta", 0.95), doc("delta", 0.5)]},
+    ]
+    fused = builder.fuse(results)
+
+    assert [document.page_content for document in fused][:1] == ["beta"]
+    assert sorted(document.page_content for document in fused) == ["alpha", "beta", "delta", "gamma"]
+    beta = fused[0].metadata["rrf_score"]
+    assert abs(beta - (1 / 62 + 1 / 61)) < 1e-12
+
+
+def test_duplicates_differing_only_in_case_and_spaces_are_merged():
+    builder = ContextBuilder()
+    fused = builder.fuse([{"Splited_text": [doc("The  Vector index"), doc("the vector\nindex", 0.5)]}])
+    assert len(fused) == 1
+
+
+def test_the_formatted_context_fits_the_token_budget():
+    #Many short chunks, where the "[i] (collection) " prefixes and separators weigh as much as the text
+    chunks = [doc(f"chunk {index} text", 1.0 - index / 100) for index in range(60)]
+    builder = ContextBuilder(token_budget=100)
+    selected = builder.build([{"Splited_text": chunks}])
+
+    assert selected
+    assert count_tokens(builder.format(selected)) <= 100
+    #Counting only the page content would have let in more chunks than fit
+    assert sum(count_tokens(document.page_content) for document in chunks) > 100
+
+
+def test_expand_replaces_chunks_by_their_page_once():
+    docstore.put_pages("expanded.pdf", [(0, "the whole first page"), (1, "the whole second page")])
+    builder = ContextBuilder(expand_parents=True)
+    documents = [
+        doc("first chunk", parent_id=parent_id("expanded.pdf", 0)),
+        doc("summary", collection="Summary"),
+        doc("second chunk", parent_id=parent_id("expanded.pdf", 0)),
+        doc("orphan chunk", parent_id=parent_id("expanded.pdf", 7)),
+    ]
+    expanded = builder.expand(documents)
+
+    assert [document.page_content for document in expanded] == ["the whole first page", "summary", "orphan chunk"]
+    assert expanded[0].metadata["parent_id"] == parent_id("expanded.pdf", 0)
@@ -0,0 +1,49 @@
+import io
+
+import benchmark
+from db import VectorDB
+from ingest_data import IngestData
+from ingest_manifest import content_hash, ingest_manifest, point_id
+
+
+def ingest(data, name):
+    upload = io.BytesIO(data)
+    upload.name = name
+    IngestData(pdf_paths=[upload]).load_data_to_db()
+
+
+def stored_points():
+    client = VectorDB(text=None).check_connection_qdrant()
+    return {collection: client.count(collection_name=collection).count for collection in ("Summary", "Splited_text")}
+
+
+def test_point_ids_depend_only_on_the_source_and_content():
+    assert point_id("a.pdf", "chunk") == point_id("a.pdf", "chunk")
+    assert point_id("a.pdf", "chunk") != point_id("b.pdf", "chunk")
+    assert content_hash(io.BytesIO(b"pdf")) == content_hash(b"pdf")
+
+
+def test_reingesting_an_unchanged_pdf_embeds_and_stores_nothing(offline_ingest):
+    pdf = benchmark.make_pdf(3, seed=11)
+    ingest(pdf, "manual.pdf")
+    embedded, points = offline_ingest.embedded, stored_points()
+    assert embedded > 0 and points["Splited_text"] > 0
+    assert ingest_manifest.is_unchanged("manual.pdf", content_hash(pdf))
+
+    ingest(pdf, "manual.pdf")
+    assert offline_ingest.embedded == embedded
+    assert stored_points() == points
+
+
+def test_reingesting_a_changed_pdf_replaces_its_points(offline_ingest):
+    ingest(benchmark.make_pdf(3, seed=21), "report.pdf")
+    before = ingest_manifest.point_ids("report.pdf")["Splited_text"]
+
+    changed = benchmark.make_pdf(3, seed=22)
+    ingest(changed, "report.pdf")
+    after = ingest_manifest.point_ids("report.pdf")["Splited_text"]
+
+    assert ingest_manifest.is_unchanged("report.pdf", content_hash(changed))
+    assert after != before
+    #The points of the old version were deleted, no orphans are left
+    assert stored_points()["Splited_text"] == len(after)
@@ -0,0 +1,50 @@
+from lexical_index import LexicalIndex, tokenize
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def test_codes_are_kept_whole_and_split():
+    assert tokenize("See ISO-9001 section 4.2") == ["see", "iso-9001", "iso", "9001", "section", "4.2", "4", "2"]
+
+
+def test_add_chunks_only_adds_the_new_ones(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite"))
+    assert index.add_chunks("a.pdf", [("1", "qdrant stores vectors", 0)]) == 1
+    assert index.add_chunks("a.pdf", [("1", "qdrant stores vectors", 0), ("2", "bm25 ranks chunks", 1)]) == 1
+    assert index.stats()["chunks"] == 2
+    assert ids(index.search("bm25")) == ["2"]
+
+
+def test_prune_source_removes_the_gone_chunks(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite"))
+    index.add_chunks("a.pdf", [("1", "qdrant stores vectors", 0), ("2", "bm25 ranks chunks", 1)])
+    index.add_chunks("b.pdf", [("3", "qdrant in another document", 0)])
+
+    assert index.prune_source("a.pdf", {"2"}) == 1
+    assert ids(index.search("qdrant")) == ["3"]
+    #The terms of the removed chunk are gone from the postings too
+    index.prune_source("b.pdf", set())
+    assert index.search("qdrant") == []
+    assert not index.has_source("b.pdf")
+
+
+def test_replace_source_and_reload_from_disk(tmp_path):
+    path = str(tmp_path / "lexical.sqlite")
+    index = LexicalIndex(path)
+    index.replace_source("a.pdf", [("1", "old page about hnsw", 0), ("2", "page about quantization", 1)])
+    index.replace_source("a.pdf", [("2", "page about quantization", 1), ("4", "new page about payload indexes", 2)])
+
+    reloaded = LexicalIndex(path)
+    assert reloaded.stats() == {"chunks": 2, "terms": index.stats()["terms"], "sources": 1}
+    assert reloaded.search("hnsw") == []
+    assert ids(reloaded.search("payload indexes")) == ["4"]
+
+
+def test_rarer_terms_rank_higher(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite"))
+    index.add_chunks("a.pdf", [("1", "vector vector search", 0), ("2", "vector search with section 4.2.1", 1),
+                               ("3", "vector database", 2)])
+    assert ids(index.search("vector 4.2.1"))[0] == "2"
+    assert len(index.search("vector", limit=2)) == 2
@@ -0,0 +1,22 @@
+import json
+import os
+
+from metrics import Metrics
+
+
+def test_export_is_throttled_on_the_hot_path(monkeypatch, tmp_path):
+    path = tmp_path / "metrics.json"
+    monkeypatch.setenv("METRICS_FILE", str(path))
+    monkeypatch.setenv("METRICS_EXPORT_INTERVAL", "60")
+    metrics = Metrics()
+
+    metrics.increment("answers_total")
+    metrics.export()
+    metrics.increment("answers_total")
+    metrics.export()
+    assert json.loads(path.read_text())["counters"][0]["value"] == 1
+
+    metrics.export(force=True)
+    assert json.loads(path.read_text())["counters"][0]["value"] == 2
+    #The temporary files are per process and thread, and none is left behind
+    assert os.listdir(tmp_path) == ["metrics.json"]
@@ -0,0 +1,57 @@
+import threading
+import time
+from unittest import mock
+
+from qdrant_pool import QdrantClientPool
+
+
+def test_reconnect_replaces_the_cached_client(tmp_path):
+    pool = QdrantClientPool()
+    client = pool.get_client("localhost", 6333, location=str(tmp_path))
+    assert pool.get_client("localhost", 6333, location=str(tmp_path)) is client
+
+    new_client = pool.reconnect("localhost", 6333, location=str(tmp_path))
+    assert new_client is not client
+    assert pool.get_client("localhost", 6333, location=str(tmp_path)) is new_client
+    pool.close_all()
+
+
+class SlowHealthPool(QdrantClientPool):
+    """A pool of stand-in clients whose health check waits until it is released."""
+
+    def __init__(self):
+        super().__init__(health_check_interval=0.0)
+        self.checking = threading.Event()
+        self.release = threading.Event()
+        self.healthy = True
+
+    def _create_client(self, host, port, grpc_port, prefer_grpc, timeout, location=None):
+        return mock.Mock(name=f"{host}:{port}")
+
+    def _is_healthy(self, client):
+        self.checking.set()
+        self.release.wait(5)
+        return self.healthy
+
+
+def test_a_slow_health_check_does_not_block_other_endpoints():
+    pool = SlowHealthPool()
+    first = pool.get_client("first", 6333)
+    pool.get_client("second", 6333)
+
+    checking = threading.Thread(target=pool.get_client, args=("first", 6333))
+    checking.start()
+    assert pool.checking.wait(5)
+    #The health check of "first" is in progress, "second" is handed out without waiting for it
+    start = time.monotonic()
+    other = threading.Thread(target=pool.get_client, args=("second", 6334))
+    other.start()
+    other.join(1)
+    assert not other.is_alive() and time.monotonic() - start < 1
+
+    pool.healthy = False
+    pool.release.set()
+    checking.join()
+    replacement = pool._clients[pool._key("first", 6333, 6334, False, 30.0, None)]
+    assert replacement is not first
+    first.close.assert_called_once()
@@ -0,0 +1,28 @@
+import pytest
+
+from db import VectorDB
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+def test_rate_limited_embedding_is_not_retried_twice():
+    db = VectorDB(text=None)
+    db.retry_backoff = 0.0
+    calls = []
+
+    def embed():
+        calls.append(1)
+        raise ResourceExhausted("429 quota exceeded")
+
+    #The limiter already retried this 429, so it is raised right away
+    with pytest.raises(ResourceExhausted):
+        db._with_retry(embed, "Embedding", rate_limited=True)
+    assert len(calls) == 1
+
+    #Without a limiter the 429 is retried here
+    calls.clear()
+    with pytest.raises(ResourceExhausted):
+        db._with_retry(embed, "Embedding")
+    assert len(calls) == db.max_retries + 1
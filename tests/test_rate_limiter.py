@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from rate_limiter import BACKGROUND, INTERACTIVE, RateLimiter, TokenBucket, is_rate_limit_error
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_BACKOFF", "0.01")
+
+
+def test_rate_limit_errors_are_recognized():
+    assert is_rate_limit_error(ResourceExhausted("quota"))
+    assert is_rate_limit_error(RuntimeError("HTTP 429 Too Many Requests"))
+    assert not is_rate_limit_error(ValueError("bad request"))
+
+
+def test_aimd_halves_on_429_grows_on_success_and_shrinks_when_slow():
+    limiter = RateLimiter("test", max_concurrency=8, min_concurrency=1, latency_target=1.0)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+
+    limiter.acquire()
+    limiter.release(latency=0.1)
+    assert limiter.limit == pytest.approx(4.25)
+
+    limiter.acquire()
+    limiter.release(latency=2.0)
+    assert limiter.limit == pytest.approx(4.25 * 0.9)
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(throttled=True)
+    assert limiter.limit == 1
+
+
+def test_the_limit_never_grows_over_the_maximum():
+    limiter = RateLimiter("test", max_concurrency=2)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(latency=0.01)
+    assert limiter.limit == 2
+
+
+def test_throttled_calls_are_retried_until_they_succeed():
+    limiter = RateLimiter("test", max_concurrency=8)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ResourceExhausted("quota")
+        return "ok"
+
+    assert limiter.call(call) == "ok"
+    assert len(attempts) == 3
+    #Halved twice, then one success adds 1 / limit
+    assert limiter.limit == pytest.approx(2.5)
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_other_errors_are_not_retried():
+    limiter = RateLimiter("test")
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.call(call)
+    assert len(attempts) == 1
+
+
+def test_interactive_calls_go_before_waiting_background_calls():
+    limiter = RateLimiter("test", max_concurrency=1)
+    order = []
+    limiter.acquire()
+
+    threads = []
+    for priority in (BACKGROUND, BACKGROUND, INTERACTIVE):
+        thread = threading.Thread(target=limiter.call, args=(lambda p=priority: order.append(p),),
+                                  kwargs={"priority": priority})
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+    limiter.release(latency=0.1)
+    for thread in threads:
+        thread.join()
+
+    assert order == [INTERACTIVE, BACKGROUND, BACKGROUND]
+
+
+def test_background_calls_leave_a_reserve_of_the_budget():
+    bucket = TokenBucket(60)
+    bucket.available = 10
+    #An interactive call can take the last units, a background call must leave 20% of the bucket (12)
+    assert bucket.wait_time(1) == 0
+    assert bucket.wait_time(1, reserve=12) > 0
+
+
+def test_the_request_budget_paces_the_calls():
+    limiter = RateLimiter("test", rpm=600, max_concurrency=8)
+    limiter.requests.available = 0
+    start = time.perf_counter()
+    for _ in range(3):
+        limiter.call(lambda: None)
+    #10 requests per second
+    assert time.perf_counter() - start == pytest.approx(0.3, abs=0.1)
+
+
+def test_async_calls_are_retried_and_release_their_slot():
+    limiter = RateLimiter("test", max_concurrency=1)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise ResourceExhausted("quota")
+        return "ok"
+
+    assert asyncio.run(limiter.acall(call)) == "ok"
+    assert limiter.stats()["in_flight"] == 0
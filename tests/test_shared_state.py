@@ -0,0 +1,43 @@
+from answer_cache import SemanticAnswerCache
+from ingest_manifest import IngestManifest
+from lexical_index import LexicalIndex
+
+#Two instances over the same files stand for two processes, for example two API workers
+
+
+def test_answer_cache_invalidation_reaches_other_processes(tmp_path):
+    path = str(tmp_path / "generation")
+    ingesting, serving = SemanticAnswerCache(generation_path=path), SemanticAnswerCache(generation_path=path)
+    generation = serving.generation
+    serving.store([1.0, 0.0], "question", "old answer", None, generation=generation)
+    assert serving.lookup([1.0, 0.0])["answer"] == "old answer"
+
+    ingesting.invalidate()
+    assert serving.lookup([1.0, 0.0]) is None
+    #An answer generated before the invalidation is not cached either
+    serving.store([1.0, 0.0], "question", "stale answer", None, generation=generation)
+    assert serving.lookup([1.0, 0.0]) is None
+
+
+def test_lexical_index_sees_chunks_added_by_other_processes(tmp_path):
+    path = str(tmp_path / "lexical.sqlite")
+    ingesting, serving = LexicalIndex(path), LexicalIndex(path)
+    assert serving.search("qdrant") == []
+
+    ingesting.replace_source("a.pdf", [("1", "qdrant vector search", 0)])
+    assert [result["id"] for result in serving.search("qdrant")] == ["1"]
+
+    ingesting.remove_source("a.pdf")
+    assert serving.search("qdrant") == []
+
+
+def test_manifest_updates_from_processes_are_merged(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    first, second = IngestManifest(path), IngestManifest(path)
+    first.update("a.pdf", "hash-a", {"Splited_text": {"1", "2"}})
+    second.update("b.pdf", "hash-b", {"Splited_text": {"3"}})
+
+    #Neither process overwrote the entry of the other, and both read the latest point IDs
+    for manifest in (first, second, IngestManifest(path)):
+        assert manifest.is_unchanged("a.pdf", "hash-a")
+        assert manifest.point_ids("b.pdf") == {"Splited_text": {"3"}}
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, normalize
+
+
+def test_normalize_ignores_case_and_spaces():
+    assert normalize("  What is   Qdrant? ") == normalize("what is qdrant?")
+
+
+def test_concurrent_calls_with_the_same_key_run_once():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["answer"] * 5
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight("test")
+    assert [flight.do(key, lambda key=key: key * 2) for key in (1, 2)] == [2, 4]
+
+
+def test_the_error_reaches_every_caller_and_is_not_cached():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3
+    #The next call runs again instead of getting the old error
+    assert flight.do("key", lambda: "ok") == "ok"
+
+
+def test_async_calls_are_coalesced():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("key", slow) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["answer"] * 4
+    assert len(calls) == 1
+
+
+def test_a_cancelled_async_leader_times_out_its_followers():
+    flight = SingleFlight("test")
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("key", asyncio.sleep, 5))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.ado("key", asyncio.sleep, 5))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.TimeoutError):
+            await follower
+
+    asyncio.run(main())
+
+
+def test_disabled_flight_runs_every_call(monkeypatch):
+    monkeypatch.setenv("SINGLE_FLIGHT", "false")
+    flight = SingleFlight("test")
+    calls = []
+    flight.do("key", calls.append, 1)
+    flight.do("key", calls.append, 1)
+    assert calls == [1, 1]
+
+
+def test_concurrent_streams_with_the_same_key_run_once():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def tokens():
+        calls.append(1)
+        yield "a"
+        release.wait(5)
+        yield "b"
+        return "done"
+
+    def consume():
+        items = yield from flight.stream("key", tokens)
+        return items
+
+    results = []
+
+    def run():
+        generator = consume()
+        items = []
+        try:
+            while True:
+                items.append(next(generator))
+        except StopIteration as stop:
+            results.append((items, stop.value))
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    #The followers that joined after the first token still get every token and the result
+    assert results == [(["a", "b"], "done")] * 4
+
+
+def test_an_abandoned_stream_times_out_its_followers():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def tokens():
+        yield "a"
+        release.wait(5)
+        yield "b"
+
+    leader = flight.stream("key", tokens)
+    assert next(leader) == "a"
+    follower = flight.stream("key", tokens)
+    assert next(follower) == "a"
+    leader.close()
+    with pytest.raises(asyncio.TimeoutError):
+        next(follower)
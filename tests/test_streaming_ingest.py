@@ -0,0 +1,94 @@
+import io
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import benchmark
+from db import StreamingWriter, VectorDB
+from docstore import docstore
+from ingest_data import IngestData
+from ingest_manifest import content_hash, ingest_manifest
+from lexical_index import lexical_index
+
+
+def stream(data, name):
+    upload = io.BytesIO(data)
+    upload.name = name
+    IngestData(pdf_paths=[upload]).load_data_to_db()
+
+
+def test_streamed_reingestion_of_a_changed_pdf_leaves_no_orphans(offline_ingest, monkeypatch):
+    monkeypatch.setenv("INGEST_STREAMING", "true")
+    monkeypatch.setenv("PARENT_DOCUMENTS", "true")
+    stream(benchmark.make_pdf(4, seed=31), "streamed.pdf")
+
+    #The new version is shorter and has other text
+    changed = benchmark.make_pdf(2, seed=32)
+    stream(changed, "streamed.pdf")
+    assert ingest_manifest.is_unchanged("streamed.pdf", content_hash(changed))
+    chunks = ingest_manifest.point_ids("streamed.pdf")["Splited_text"]
+
+    client = VectorDB(text=None).check_connection_qdrant()
+    assert client.count(collection_name="Splited_text").count == len(chunks)
+    lexical = {row[0] for row in lexical_index._connection().execute(
+        "SELECT id FROM chunks WHERE source = ?", ("streamed.pdf",))}
+    assert lexical == chunks
+    pages = {row[0] for row in docstore._connection().execute(
+        "SELECT page FROM pages WHERE source = ?", ("streamed.pdf",))}
+    assert pages == {0, 1}
+
+
+class StubCollection:
+    """Stands in for the VectorDB of a collection; `bulk_upsert` waits for `release` and can fail."""
+
+    type_collection = "Splited_text"
+    embed_batch_size = 1
+
+    def __init__(self, error=None):
+        self.error = error
+        self.release = threading.Event()
+        self.release.set()
+        self.batches = 0
+
+    def bulk_upsert(self, documents):
+        self.release.wait(5)
+        self.batches += 1
+        if self.error is not None:
+            raise self.error
+        return {"chunks": len(documents), "seconds": 0.0}
+
+
+def chunk(index):
+    return Document(page_content=f"chunk {index}", metadata={"id": f"id-{index}"})
+
+
+def test_an_error_in_the_writer_thread_reaches_the_caller():
+    writer = StreamingWriter(StubCollection(error=ConnectionError("qdrant is down")))
+    with pytest.raises(ConnectionError, match="qdrant is down"):
+        for index in range(20):
+            writer.add(chunk(index))
+            #The next flush raises the error of the batches already sent
+            time.sleep(0.01)
+        writer.close()
+    with pytest.raises(ConnectionError):
+        writer.close()
+
+
+def test_a_full_queue_blocks_the_producer():
+    collection = StubCollection()
+    collection.release.clear()
+    writer = StreamingWriter(collection, max_pending_batches=1)
+
+    producer = threading.Thread(target=lambda: [writer.add(chunk(index)) for index in range(5)])
+    producer.start()
+    #One batch is being uploaded and one waits in the queue, the producer waits for room for the third
+    producer.join(0.3)
+    assert producer.is_alive()
+    assert collection.batches == 0
+
+    collection.release.set()
+    producer.join(5)
+    assert not producer.is_alive()
+    assert writer.close()["chunks"] == 5
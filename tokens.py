@@ -0,0 +1,36 @@
+from functools import lru_cache
+
+"""
+Conteo de tokens | Token counting.
+Cuenta los tokens de un texto con tiktoken, o los estima si tiktoken no está disponible.
+"""
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """
+    Counts the tokens of a text with tiktoken, or estimates them if it is not available.
+
+    Parameters
+    ----------
+    text : str
+        The text to count.
+
+    Returns
+    -------
+    int
+        The number of tokens of the text.
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    #Around four characters per token
+    return len(text) // 4 + 1
@@ -0,0 +1,72 @@
+import threading
+import logging
+import os
+
+"""
+Trazas opcionales | Optional tracing.
+Phoenix y Langfuse solo se importan y se inician si se activan con ENABLE_PHOENIX=true o
+ENABLE_LANGFUSE=true, así el arranque de la aplicación no paga su coste cuando no se usan.
+"""
+logger = logging.getLogger(__name__)
+
+_phoenix_session = None
+_phoenix_lock = threading.Lock()
+_langfuse_handler = None
+_langfuse_lock = threading.Lock()
+
+
+def _enabled(variable):
+    return os.getenv(variable, "false").lower() == "true"
+
+
+def enable_phoenix():
+    """
+    Launches Phoenix and instruments LangChain, once per process, if ENABLE_PHOENIX=true.
+
+    Returns
+    -------
+    phoenix.Session or None
+        The Phoenix session, None when the tracing is disabled or could not start.
+    """
+    global _phoenix_session
+    if not _enabled("ENABLE_PHOENIX"):
+        return None
+    with _phoenix_lock:
+        if _phoenix_session is None:
+            try:
+                import phoenix as px
+                from phoenix.trace.langchain import LangChainInstrumentor
+
+                _phoenix_session = px.launch_app()
+                LangChainInstrumentor().instrument()
+                logger.info("Phoenix tracing enabled")
+            except Exception as e:
+                logger.warning(f"Could not start the Phoenix tracing: {e}")
+        return _phoenix_session
+
+
+def langfuse_callbacks():
+    """
+    Returns the LangChain callbacks that send the traces to Langfuse, if ENABLE_LANGFUSE=true.
+
+    The LANGFUSE_PUBLIC_KEY, LANGFUSE_SECRET_KEY and LANGFUSE_HOST variables configure the client.
+
+    Returns
+    -------
+    list
+        A single shared Langfuse handler, or an empty list when the tracing is disabled.
+    """
+    global _langfuse_handler
+    if not _enabled("ENABLE_LANGFUSE"):
+        return []
+    with _langfuse_lock:
+        if _langfuse_handler is None:
+            try:
+                from langfuse.callback import CallbackHandler
+
+                _langfuse_handler = CallbackHandler()
+                logger.info("Langfuse tracing enabled")
+            except Exception as e:
+                logger.warning(f"Could not start the Langfuse tracing: {e}")
+                return []
+        return [_langfuse_handler]